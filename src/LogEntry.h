@@ -22,15 +22,23 @@ struct LogEntry {
     template <class T>
     inline LogEntry& operator<<(const T& value) {
         #if !defined(LOG_LEVEL_DISABLED) && !defined(LOG_LVL_DISABLED)
-        std::cout << value;
+        logValue(value);
         #endif
         return *this;
     }
 
+    #if defined(LOG_FORMAT_TOKENIZED) && !defined(LOG_LEVEL_DISABLED) && !defined(LOG_LVL_DISABLED)
+    template <std::size_t N>
+    inline LogEntry& operator<<(char (&value)[N]) {
+        logValue(static_cast<const char*>(value));
+        return *this;
+    }
+    #endif
+
     #ifdef LOG_ARDUINO
     inline LogEntry& operator<<(const String& value) {
         #if !defined(LOG_LEVEL_DISABLED) && !defined(LOG_LVL_DISABLED)
-        std::cout << value.c_str();
+        logValue(value.c_str());
         #endif
         return *this;
     }
@@ -42,7 +50,7 @@ struct LogEntryWithPrefix : LogEntry<level> {
     LogEntryWithPrefix(const LogEntryWithPrefix&) = delete;
     LogEntryWithPrefix(): LogEntry<level>() {
         #if !defined(LOG_LEVEL_DISABLED) && !defined(LOG_LVL_DISABLED)
-        #ifndef LOG_FORMAT_WITHOUT_PREFIX
+        #if !defined(LOG_FORMAT_WITHOUT_PREFIX) || defined(LOG_FORMAT_BINARY)
         logPrefix<level>();
         #endif
         #endif
@@ -55,7 +63,7 @@ struct LogEntryWithEndl : LogEntry<level> {
     LogEntryWithEndl(): LogEntry<level>() {}
     ~LogEntryWithEndl() {
         #if !defined(LOG_LEVEL_DISABLED) && !defined(LOG_LVL_DISABLED)
-        std::cout << std::endl;
+        logEndl();
         #endif
     }
 };
@@ -65,7 +73,7 @@ struct LogEntryWithPrefixAndEndl : LogEntry<level> {
     LogEntryWithPrefixAndEndl(const LogEntryWithPrefixAndEndl&) = delete;
     LogEntryWithPrefixAndEndl(): LogEntry<level>() {
         #if !defined(LOG_LEVEL_DISABLED) && !defined(LOG_LVL_DISABLED)
-        #ifndef LOG_FORMAT_WITHOUT_PREFIX
+        #if !defined(LOG_FORMAT_WITHOUT_PREFIX) || defined(LOG_FORMAT_BINARY)
         logPrefix<level>();
         #endif
         #endif
@@ -73,7 +81,7 @@ struct LogEntryWithPrefixAndEndl : LogEntry<level> {
 
     ~LogEntryWithPrefixAndEndl() {
         #if !defined(LOG_LEVEL_DISABLED) && !defined(LOG_LVL_DISABLED)
-        std::cout << std::endl;
+        logEndl();
         #endif
     }
 };
@@ -3,3 +3,52 @@
 #ifdef LOGGER_WITH_MUTEX
 std::recursive_mutex loggerMutex{};
 #endif
+
+#if !defined(LOG_LEVEL_DISABLED) && !defined(LOG_LVL_DISABLED) && defined(LOG_FORMAT_BINARY)
+#include "LogArduino.h"
+
+#ifndef LOG_ARDUINO
+#include <chrono>
+#endif
+
+LogFrameBuffer logFrameBuffer{};
+std::ostream logFrameStream(&logFrameBuffer);
+
+static uint32_t logTimestamp() {
+    #ifdef LOG_ARDUINO
+    return millis();
+    #else
+    return std::chrono::duration_cast<std::chrono::milliseconds>(
+        std::chrono::steady_clock::now().time_since_epoch()).count();
+    #endif
+}
+
+void LogFrameBuffer::begin(uint8_t level) {
+    this->level = level;
+    timestamp = logTimestamp();
+    setp(payload, payload + LOG_FORMAT_BINARY_MAX_LENGTH);
+}
+
+void LogFrameBuffer::end() {
+    uint32_t length = pptr() - pbase();
+    std::cout.put(static_cast<char>(LOG_FORMAT_BINARY_MAGIC));
+    std::cout.put(static_cast<char>(level));
+    logVarint(std::cout, timestamp);
+    logVarint(std::cout, length);
+    std::cout.write(payload, length);
+    std::cout.flush();
+    setp(nullptr, nullptr);
+}
+
+LogFrameBuffer::int_type LogFrameBuffer::overflow(int_type ch) {
+    return traits_type::not_eof(ch);
+}
+
+void logVarint(std::ostream& stream, uint64_t value) {
+    while (value >= 0x80) {
+        stream.put(static_cast<char>(value | 0x80));
+        value >>= 7;
+    }
+    stream.put(static_cast<char>(value));
+}
+#endif
@@ -15,8 +15,62 @@ extern std::recursive_mutex loggerMutex;
 #define LOG_FORMAT_SEPARATOR ": "
 #endif
 
+#if defined(LOG_FORMAT_TOKENIZED) && !defined(LOG_FORMAT_BINARY)
+#define LOG_FORMAT_BINARY
+#endif
+
+#ifdef LOG_FORMAT_BINARY
+#include <cstdint>
+#include <type_traits>
+
+#ifndef LOG_FORMAT_BINARY_MAX_LENGTH
+#define LOG_FORMAT_BINARY_MAX_LENGTH 256
+#endif
+
+#define LOG_FORMAT_BINARY_MAGIC 0xFE
+#define LOG_FORMAT_BINARY_WITHOUT_PREFIX 0x80
+#define LOG_FORMAT_BINARY_TOKENIZED 0x40
+
+#ifdef LOG_FORMAT_TOKENIZED
+#define LOG_FORMAT_BINARY_FLAGS LOG_FORMAT_BINARY_TOKENIZED
+#else
+#define LOG_FORMAT_BINARY_FLAGS 0
+#endif
+
+class LogFrameBuffer : public std::streambuf {
+public:
+    void begin(uint8_t level);
+    void end();
+
+protected:
+    int_type overflow(int_type ch) override;
+
+private:
+    char payload[LOG_FORMAT_BINARY_MAX_LENGTH];
+    uint8_t level = 0;
+    uint32_t timestamp = 0;
+};
+
+extern LogFrameBuffer logFrameBuffer;
+extern std::ostream logFrameStream;
+
+void logVarint(std::ostream& stream, uint64_t value);
+
+#define LOG_STREAM logFrameStream
+#else
+#define LOG_STREAM std::cout
+#endif
+
 template <LogLevel level>
 constexpr void logPrefix() {
+    #ifdef LOG_FORMAT_BINARY
+    #ifdef LOG_FORMAT_WITHOUT_PREFIX
+    logFrameBuffer.begin(
+        static_cast<uint8_t>(level) | LOG_FORMAT_BINARY_FLAGS | LOG_FORMAT_BINARY_WITHOUT_PREFIX);
+    #else
+    logFrameBuffer.begin(static_cast<uint8_t>(level) | LOG_FORMAT_BINARY_FLAGS);
+    #endif
+    #else
     if constexpr (level == LogLevel::trace)
         std::cout << "TRC" << LOG_FORMAT_SEPARATOR;
     if constexpr (level == LogLevel::debug)
@@ -27,6 +81,53 @@ constexpr void logPrefix() {
         std::cout << "WRN" << LOG_FORMAT_SEPARATOR;
     if constexpr (level == LogLevel::error)
         std::cout << "ERR" << LOG_FORMAT_SEPARATOR;
+    #endif
+}
+
+#ifdef LOG_FORMAT_TOKENIZED
+template <class T>
+inline void logValue(const T& value) {
+    if constexpr (std::is_same_v<T, bool>) {
+        logFrameStream.put('b');
+        logFrameStream.put(value);
+    } else if constexpr (std::is_same_v<T, char>) {
+        logFrameStream.put('c');
+        logFrameStream.put(value);
+    } else if constexpr (std::is_integral_v<T> && std::is_signed_v<T>) {
+        logFrameStream.put('i');
+        logVarint(logFrameStream, static_cast<uint64_t>(value) << 1 ^
+                                  static_cast<uint64_t>(static_cast<int64_t>(value) >> 63));
+    } else if constexpr (std::is_integral_v<T>) {
+        logFrameStream.put('u');
+        logVarint(logFrameStream, value);
+    } else if constexpr (std::is_floating_point_v<T> && (sizeof(T) == 4 || sizeof(T) == 8)) {
+        logFrameStream.put(sizeof(T) == 4 ? 'f' : 'd');
+        logFrameStream.write(reinterpret_cast<const char*>(&value), sizeof(T));
+    } else {
+        logFrameStream.put('z');
+        logFrameStream << value;
+        logFrameStream.put('\0');
+    }
+}
+
+template <std::size_t N>
+inline void logValue(const char (&value)[N]) {
+    logFrameStream.put('s');
+    logVarint(logFrameStream, reinterpret_cast<uintptr_t>(value));
+}
+#else
+template <class T>
+inline void logValue(const T& value) {
+    LOG_STREAM << value;
+}
+#endif
+
+inline void logEndl() {
+    #ifdef LOG_FORMAT_BINARY
+    logFrameBuffer.end();
+    #else
+    std::cout << std::endl;
+    #endif
 }
 
 #endif
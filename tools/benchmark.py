@@ -0,0 +1,471 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import textwrap
+import tempfile
+import time
+from collections import deque
+from serial_monitor import LogsFile, CursorMove, PrefixTrie, FlushPolicy, Fsync, \
+    LogsDecoder, LogsFilter, FieldPattern, search_archives, layout_text, FRAME_MAGIC, \
+    FRAME_TOKENIZED, LEVEL_NAMES, FIELD_KEY_VALUE
+
+
+SAMPLE_LOGS = [
+    'DBG: sensor poll finished',
+    'INF: temp=23.4 rpm=1200 vbat=3.71',
+    'WRN: retrying connection to 192.168.0.17',
+    'ERR: żółć checksum mismatch',
+]
+
+
+def read_lines_bytewise(file, begin: int, end: int):
+    pointer_location = begin
+    buffer = bytearray()
+    while pointer_location < end:
+        file.seek(pointer_location)
+        pointer_location += 1
+        new_byte = file.read(1)
+        if new_byte == b'\n':
+            yield buffer.decode()
+            buffer = bytearray()
+        else:
+            buffer.extend(new_byte)
+    if len(buffer) > 0:
+        yield buffer.decode()
+
+
+def read_lines_reverse_bytewise(file, begin: int, end: int = 0):
+    pointer_location = begin - 1
+    buffer = bytearray()
+    while pointer_location >= end:
+        file.seek(pointer_location)
+        pointer_location -= 1
+        new_byte = file.read(1)
+        if new_byte == b'\n':
+            yield buffer[::-1].decode()
+            buffer = bytearray()
+        else:
+            buffer.extend(new_byte)
+    if len(buffer) > 0:
+        yield buffer[::-1].decode()
+
+
+def layout_text_charwise(text: str, cols: int, wrap_around: bool, insert_spaces: bool):
+    col = 0
+    formated_text = ''
+    for ch in text:
+        if wrap_around and col >= cols:
+            col = 0
+            formated_text += '\n'
+        formated_text += ch
+        col += 1
+        if insert_spaces:
+            if wrap_around and col >= cols:
+                col = 0
+                formated_text += '\n'
+            else:
+                formated_text += ' '
+                col += 1
+    return formated_text
+
+
+def fill_logs_file(logs_file: LogsFile, size: int):
+    line_num = 0
+    while logs_file.size < size:
+        logs_file.write_log(f"{SAMPLE_LOGS[line_num % len(SAMPLE_LOGS)]} #{line_num}",
+                            None,
+                            line_num % len(SAMPLE_LOGS))
+        line_num += 1
+    return line_num
+
+
+def measure(name: str, func, *args):
+    start = time.perf_counter()
+    lines = sum(1 for _ in func(*args))
+    elapsed = time.perf_counter() - start
+    print(f"  {name:<24} {elapsed * 1000:10.1f} ms {lines:>10} lines")
+    return elapsed
+
+
+def measure_call(name: str, func, *args):
+    start = time.perf_counter()
+    func(*args)
+    elapsed = time.perf_counter() - start
+    print(f"  {name:<24} {elapsed * 1000:10.3f} ms")
+    return elapsed
+
+
+def bench_read_lines(size: int):
+    print(f"Read lines ({size / 1024 / 1024:.1f} MB):")
+    with tempfile.TemporaryDirectory() as logs_dir:
+        logs_file = LogsFile(logs_dir)
+        lines_count = fill_logs_file(logs_file, size)
+        eof_pos = logs_file.size
+        logs_file.segments[0].flush()
+
+        indexed = measure('indexed', logs_file._read_range, 0, lines_count)
+        bytewise = measure('bytewise forward',
+                           read_lines_bytewise, logs_file.segments[0].reader, 0, eof_pos)
+        print(f"  speedup {bytewise / indexed:.1f}x")
+        bytewise = measure('bytewise reverse',
+                           read_lines_reverse_bytewise, logs_file.segments[0].reader, eof_pos)
+        print(f"  speedup {bytewise / indexed:.1f}x")
+
+
+def bench_write(lines_count: int = 100000):
+    print(f"Write ({lines_count} lines):")
+    policies = [('buffered', FlushPolicy()),
+                ('flush every line', FlushPolicy(size=0)),
+                ('fsync on flush', FlushPolicy(fsync=Fsync.FLUSH)),
+                ('fsync every line', FlushPolicy(fsync=Fsync.LINE))]
+    for name, policy in policies:
+        with tempfile.TemporaryDirectory() as logs_dir:
+            logs_file = LogsFile(logs_dir, flush_policy=policy)
+            count = lines_count if policy.fsync != Fsync.LINE else lines_count // 100
+            start = time.perf_counter()
+            for line_num in range(count):
+                logs_file.write_log(f"{SAMPLE_LOGS[line_num % len(SAMPLE_LOGS)]} #{line_num}")
+            logs_file.close()
+            elapsed = time.perf_counter() - start
+            print(f"  {name:<24} {count / elapsed:12.0f} lines/s")
+
+
+def bench_memory(size: int, rows: int = 50):
+    print(f"Storage ({size / 1024 / 1024:.1f} MB, {rows} rows):")
+    for name, memory_size in [('disk', 0), ('memory', size * 2), ('memory ring 1/4', size // 4)]:
+        with tempfile.TemporaryDirectory() as logs_dir:
+            logs_file = LogsFile(logs_dir, memory_size=memory_size)
+            start = time.perf_counter()
+            lines_count = fill_logs_file(logs_file, size)
+            elapsed = time.perf_counter() - start
+            logs_file.read_logs(rows)
+            print(f"  {name:<24} {lines_count / elapsed:12.0f} lines/s")
+            measure(f"{name} read all",
+                    logs_file._read_range, logs_file.first_line, logs_file.lines_count)
+            measure_call(f"{name} page up", logs_file.move_cursor, CursorMove.UP, rows)
+            measure_call(f"{name} search", logs_file.search, 'missing')
+            measure_call(f"{name} filter", logs_file.set_filter, 'checksum')
+
+
+def search_lines(logs_file: LogsFile, text: str):
+    for line in logs_file._read_range(0, logs_file.lines_count):
+        if text in line:
+            yield line
+            return
+
+
+def bench_search(size: int):
+    print(f"Search ({size / 1024 / 1024:.1f} MB):")
+    with tempfile.TemporaryDirectory() as logs_dir:
+        logs_file = LogsFile(logs_dir)
+        fill_logs_file(logs_file, size)
+        logs_file.write_log('INF: needle')
+        logs_file.read_logs(50)
+
+        lines_loop = measure('lines loop', search_lines, logs_file, 'needle')
+        logs_file.goto_line(1)
+        mapped = measure_call('mapped', logs_file.search, 'needle')
+        print(f"  speedup {lines_loop / mapped:.1f}x")
+
+
+def bench_filter(size: int):
+    print(f"Filter ({size / 1024 / 1024:.1f} MB):")
+    expressions = ['checksum', '(?i)CHECKSUM', 'ERR !mismatch', 'retrying | checksum',
+                   r'/rpm=\d+0 /', 'level:WRN+']
+    with tempfile.TemporaryDirectory() as logs_dir:
+        logs_file = LogsFile(logs_dir)
+        fill_logs_file(logs_file, size)
+        logs_file.read_logs(50)
+        logs = logs_file._read_range(0, logs_file.lines_count)
+
+        start = time.perf_counter()
+        lines = sum(1 for log in logs if 'checksum' in log)
+        elapsed = time.perf_counter() - start
+        print(f"  {'substring':<24} {elapsed / len(logs) * 1e9:8.0f} ns/line {lines:>10} lines")
+        for expression in expressions:
+            matcher = LogsFilter(expression)
+            start = time.perf_counter()
+            lines = sum(1 for log in logs if matcher.match(log))
+            elapsed = time.perf_counter() - start
+            start = time.perf_counter()
+            logs_file.set_filter(expression)
+            scan = time.perf_counter() - start
+            assert len(logs_file.matches[logs_file.selection]) == lines
+            print(f"  {expression:<24} {elapsed / len(logs) * 1e9:8.0f} ns/line {lines:>10} lines"
+                  f" {scan * 1000:10.1f} ms scan")
+
+
+def bench_archive_search(size: int, sessions: int = 4):
+    print(f"Archive search ({size / 1024 / 1024:.1f} MB, {sessions} sessions):")
+    with tempfile.TemporaryDirectory() as logs_dir:
+        for _ in range(sessions):
+            logs_file = LogsFile(logs_dir)
+            fill_logs_file(logs_file, size // sessions)
+            logs_file.close()
+            time.sleep(.01)
+        workers_counts = sorted({1, 2, 4, os.cpu_count()})
+        for expression in ['checksum', 'level:WRN+ !retrying']:
+            for workers in workers_counts:
+                start = time.perf_counter()
+                lines = sum(1 for _ in search_archives(logs_dir, expression, workers))
+                elapsed = time.perf_counter() - start
+                print(f"  {expression:<24} {workers:>3} workers {elapsed * 1000:10.1f} ms"
+                      f" {lines:>10} lines")
+
+
+def bench_navigation(size: int, rows: int = 50):
+    print(f"Navigation ({size / 1024 / 1024:.1f} MB, {rows} rows):")
+    with tempfile.TemporaryDirectory() as logs_dir:
+        logs_file = LogsFile(logs_dir)
+        fill_logs_file(logs_file, size)
+        logs_file.read_logs(rows)
+
+        measure_call('goto 50%', logs_file.goto_percentage, 50)
+        measure_call('goto line 1', logs_file.goto_line, 1)
+        measure_call('page down', logs_file.move_cursor, CursorMove.DOWN, rows)
+        measure_call('goto 100%', logs_file.goto_percentage, 100)
+        measure_call('page up', logs_file.move_cursor, CursorMove.UP, rows)
+        measure_call('line up', logs_file.move_cursor, CursorMove.UP)
+        measure_call('search', logs_file.search, 'ERR')
+        measure_call('unhold', logs_file.unhold_cursor)
+        measure_call('filter', logs_file.set_filter, 'ERR')
+        measure_call('filtered page up', logs_file.move_cursor, CursorMove.UP, rows)
+        measure_call('filter other', logs_file.set_filter, 'WRN')
+        measure_call('filter cached', logs_file.set_filter, 'ERR')
+        measure_call('filtered page down', logs_file.move_cursor, CursorMove.DOWN, rows)
+
+
+def bench_levels(size: int, rows: int = 50):
+    print(f"Levels ({size / 1024 / 1024:.1f} MB):")
+    with tempfile.TemporaryDirectory() as logs_dir:
+        logs_file = LogsFile(logs_dir)
+        fill_logs_file(logs_file, size)
+        logs_file.read_logs(rows)
+        entries_count = len(SAMPLE_LOGS)
+
+        measure('count by text', lambda: filter(
+            lambda log: log.startswith('WRN: '),
+            logs_file._read_range(logs_file.first_line, logs_file.lines_count)))
+        measure_call('count entries', logs_file.count_entries,
+                     logs_file.first_line, logs_file.lines_count, entries_count)
+        measure_call('count range 10%', logs_file.count_entries,
+                     logs_file.lines_count // 2, logs_file.lines_count * 6 // 10, entries_count)
+        measure_call('hide by filter', logs_file.set_filter, 'level:INF+')
+        measure_call('clear filter', logs_file.set_filter, '')
+        measure_call('hide entry', logs_file.set_hidden, frozenset([0]))
+        measure_call('hidden page up', logs_file.move_cursor, CursorMove.UP, rows)
+        measure_call('hide other', logs_file.set_hidden, frozenset([0, 1]))
+        measure_call('hide cached', logs_file.set_hidden, frozenset([0]))
+        measure_call('hidden and filter', logs_file.set_filter, 'checksum')
+        logs_file.set_filter('')
+        measure_call('show all', logs_file.set_hidden, frozenset())
+
+
+def bench_visible_buffer(lines_count: int = 200000):
+    print(f"Visible buffer ({lines_count} lines):")
+    logs = [f"{SAMPLE_LOGS[num % len(SAMPLE_LOGS)]} #{num}" for num in range(lines_count)]
+    for rows in [50, 200, 1000, 5000]:
+        start = time.perf_counter()
+        buffer = list()
+        for log in logs:
+            buffer.append(log)
+            if len(buffer) > rows:
+                buffer.pop(0)
+        pop = time.perf_counter() - start
+
+        start = time.perf_counter()
+        buffer = deque(maxlen=rows)
+        for log in logs:
+            buffer.append(log)
+        ring = time.perf_counter() - start
+
+        with tempfile.TemporaryDirectory() as logs_dir:
+            logs_file = LogsFile(logs_dir)
+            logs_file.read_logs(rows)
+            start = time.perf_counter()
+            for log in logs:
+                logs_file.write_log(log)
+            write = time.perf_counter() - start
+            start = time.perf_counter()
+            logs_file.unhold_cursor()
+            unhold = time.perf_counter() - start
+
+        print(f"  {rows:>5} rows  list pop {pop / lines_count * 1e9:6.0f} ns/line"
+              f"  deque {ring / lines_count * 1e9:6.0f} ns/line"
+              f"  write {lines_count / write:10.0f} lines/s  unhold {unhold * 1000:.3f} ms")
+
+
+def bench_layout(lines_count: int = 1000, cols: int = 80):
+    print(f"Status layout ({lines_count} lines, {cols} cols):")
+    for length in [80, 1000, 10000]:
+        for name, text, insert_spaces in [('ascii', 'rpm=1200 ', False),
+                                          ('ascii', 'rpm=1200 ', True),
+                                          ('narrow', 'temp=23°C ', False),
+                                          ('narrow', 'temp=23°C ', True),
+                                          ('wide', '温度=23 ', False),
+                                          ('wide', '温度=23 ', True),
+                                          ('cjk', '温度传感器读数正常', False),
+                                          ('cjk', '温度传感器读数正常', True)]:
+            logs = [(text * (length // len(text) + 1))[:length - 8] + f"{num:08d}"
+                    for num in range(lines_count)]
+            start = time.perf_counter()
+            for log in logs:
+                layout_text_charwise(log, cols, True, insert_spaces)
+            charwise = time.perf_counter() - start
+
+            start = time.perf_counter()
+            for log in logs:
+                layout_text.__wrapped__(log, cols, True, insert_spaces)
+            sliced = time.perf_counter() - start
+
+            start = time.perf_counter()
+            for _ in range(lines_count):
+                layout_text(logs[0], cols, True, insert_spaces)
+            cached = time.perf_counter() - start
+
+            case = f"{length} {name}{' spaces' if insert_spaces else ''}"
+            print(f"  {case:<20} charwise {charwise / lines_count * 1e6:8.1f} us/line"
+                  f"  layout {sliced / lines_count * 1e6:8.1f} us/line"
+                  f"  cached {cached / lines_count * 1e6:6.2f} us/line")
+
+
+def bench_fields(lines_count: int = 20000):
+    print(f"Fields ({lines_count} lines):")
+    for fields_count in [4, 16, 64]:
+        names = [f"v{num}" for num in range(fields_count)]
+        logs = ['INF: ' + ' '.join(f"{name}={num % 97}.{num % 7}" for name in names)
+                for num in range(lines_count)]
+
+        values = dict()
+        start = time.perf_counter()
+        for log in logs:
+            for name in names:
+                begin = log.find(f" {name}=")
+                if begin >= 0:
+                    begin += len(name) + 2
+                    end = log.find(' ', begin)
+                    values[name] = log[begin:end if end >= 0 else len(log)]
+        scan = time.perf_counter() - start
+
+        field_pattern = FieldPattern('INF: ', FIELD_KEY_VALUE)
+        sinks = dict(map(lambda name: (name, [values.__setitem__]), names))
+        start = time.perf_counter()
+        for log in logs:
+            for name, value in field_pattern.parse(log):
+                for sink in sinks.get(name, ()):
+                    sink(name, value)
+        parse = time.perf_counter() - start
+
+        print(f"  {fields_count:>5} fields  scan per field {scan / lines_count * 1e6:8.1f} us/line"
+              f"  parse once {parse / lines_count * 1e6:8.1f} us/line")
+
+
+def bench_dispatch(lines_count: int = 100000):
+    print(f"Prefix dispatch ({lines_count} lines):")
+    for prefixes_count in [4, 16, 128, 1024]:
+        prefixes = [f"S{num:04d}: " for num in range(prefixes_count)]
+        logs = [f"{prefixes[num % prefixes_count]}value {num}" for num in range(lines_count)]
+
+        start = time.perf_counter()
+        for log in logs:
+            [prefix for prefix in prefixes if log.startswith(prefix)]
+        linear = time.perf_counter() - start
+
+        trie = PrefixTrie()
+        for prefix in prefixes:
+            trie.add(prefix, prefix)
+        trie.compile()
+        start = time.perf_counter()
+        for log in logs:
+            trie.match(log)
+        tree = time.perf_counter() - start
+
+        framed = [(log, prefixes[num % prefixes_count]) for num, log in enumerate(logs)]
+        start = time.perf_counter()
+        for log, prefix in framed:
+            trie.match(log, prefix)
+        known = time.perf_counter() - start
+
+        print(f"  {prefixes_count:>5} prefixes  linear {linear / lines_count * 1e9:8.0f} ns/line"
+              f"  trie {tree / lines_count * 1e9:8.0f} ns/line"
+              f"  known prefix {known / lines_count * 1e9:6.0f} ns/line")
+
+
+def encode_varint(value: int):
+    data = bytearray()
+    while value >= 0x80:
+        data.append(value & 0x7f | 0x80)
+        value >>= 7
+    data.append(value)
+    return bytes(data)
+
+
+def encode_frame(log: str, timestamp: int, flags: int = 0, payload: bytes = None):
+    level = LEVEL_NAMES.index(log[:3])
+    if payload is None:
+        payload = log[len('XXX: '):].encode()
+    return FRAME_MAGIC + bytes([level | flags]) + encode_varint(timestamp) + \
+        encode_varint(len(payload)) + payload
+
+
+def encode_tokenized_frame(log: str, timestamp: int, strings: dict):
+    text, _, num = log[len('XXX: '):].rpartition('#')
+    address = 0x3f400000 + 64 * SAMPLE_LOGS.index(log[:len(log) - len(num) - 2])
+    strings[address] = f"{text}#"
+    payload = b's' + encode_varint(address) + b'u' + encode_varint(int(num))
+    return encode_frame(log, timestamp, FRAME_TOKENIZED, payload)
+
+
+def bench_decode(lines_count: int = 100000, chunk_size: int = 256):
+    print(f"Decode ({lines_count} lines, {chunk_size} B chunks):")
+    logs = [f"{SAMPLE_LOGS[num % len(SAMPLE_LOGS)]} #{num}" for num in range(lines_count)]
+    strings = dict()
+    noisy_logs = [log + '\ufffd' if num % 100 == 0 else log for num, log in enumerate(logs)]
+    noisy_stream = b''.join(f"{log}\r\n".encode().replace('\ufffd'.encode(), b'\xff')
+                            for log in noisy_logs)
+    streams = [('text', logs, b''.join(f"{log}\r\n".encode() for log in logs)),
+               ('noisy', noisy_logs, noisy_stream),
+               ('binary', logs, b''.join(encode_frame(log, num * 10)
+                                         for num, log in enumerate(logs))),
+               ('tokenized', logs, b''.join(encode_tokenized_frame(log, num * 10, strings)
+                                            for num, log in enumerate(logs)))]
+    for name, expected, stream in streams:
+        decoder = LogsDecoder(strings=strings)
+        start = time.perf_counter()
+        decoded = list()
+        for begin in range(0, len(stream), chunk_size):
+            decoded += decoder.feed(stream[begin:begin + chunk_size])
+        elapsed = time.perf_counter() - start
+        assert list(map(lambda log: log[0], decoded)) == expected
+        print(f"  {name:<10} {len(stream) / len(decoded):6.1f} B/line"
+              f" {elapsed / len(decoded) * 1e9:8.0f} ns/line {len(decoded):>10} lines")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=textwrap.dedent("""
+        Micro-benchmarks of serial monitor internals.
+        """),
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=float, default=1,
+                        help="Size of generated logs file in MB")
+    args = parser.parse_args()
+
+    size = int(args.size * 1024 * 1024)
+    bench_write()
+    bench_read_lines(size)
+    bench_memory(size)
+    bench_search(size)
+    bench_filter(size)
+    bench_archive_search(size)
+    bench_navigation(size)
+    bench_levels(size)
+    bench_visible_buffer()
+    bench_layout()
+    bench_fields()
+    bench_dispatch()
+    bench_decode()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+import argparse
+import textwrap
+import tempfile
+import threading
+import curses
+import os
+import time
+import yaml
+import serial
+from unittest import mock
+from benchmark import SAMPLE_LOGS
+from serial_monitor import LogsMonitor, SerialReader, LogsDecoder, CursorMove
+
+
+CHUNK_SIZE = 64 * 1024
+
+
+class FakeWindow():
+    def __init__(self, rows: int, cols: int):
+        self.rows = rows
+        self.cols = cols
+
+    def getmaxyx(self):
+        return self.rows, self.cols
+
+    def derwin(self, rows: int, cols: int, row: int, col: int):
+        return FakeWindow(rows, cols)
+
+    def addstr(self, row: int, col: int, text: str, attr: int = 0):
+        pass
+
+    def bkgdset(self, ch: str, attr: int = 0):
+        pass
+
+    def getch(self):
+        return -1
+
+    def clear(self):
+        pass
+
+    def erase(self):
+        pass
+
+    def refresh(self):
+        pass
+
+    def noutrefresh(self):
+        pass
+
+    def idlok(self, flag: bool):
+        pass
+
+    def scrollok(self, flag: bool):
+        pass
+
+    def scroll(self, lines: int):
+        pass
+
+
+class FakePort():
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.in_waiting = CHUNK_SIZE
+        self.reader = None
+        self.ready, ready_writer = os.pipe()
+        os.write(ready_writer, b'\0')
+
+    def fileno(self):
+        return self.ready
+
+    def read(self, size: int):
+        while len(self.reader.logs) > self.reader.queue_size // 2:
+            time.sleep(.001)
+        chunk = next(self.chunks, None)
+        if chunk is None:
+            raise serial.serialutil.SerialException('end of input')
+        return chunk
+
+
+class PtyPort():
+    def __init__(self, chunks):
+        self.master, slave = os.openpty()
+        self.ser = serial.Serial(os.ttyname(slave), timeout=0)
+        os.close(slave)
+        self.writer = threading.Thread(target=self._write, args=(chunks,), daemon=True)
+        self.writer.start()
+
+    def fileno(self):
+        return self.ser.fileno()
+
+    @property
+    def in_waiting(self):
+        return self.ser.in_waiting
+
+    def read(self, size: int):
+        return self.ser.read(size)
+
+    def _write(self, chunks):
+        for chunk in chunks:
+            os.write(self.master, chunk)
+        time.sleep(.1)
+        while self.ser.in_waiting:
+            time.sleep(.01)
+        os.close(self.master)
+
+
+def generate_chunks(size: int, replay: str = None):
+    if replay:
+        with open(replay, 'rb') as file:
+            sample = file.read()
+    else:
+        sample = ''.join(f"{SAMPLE_LOGS[num % len(SAMPLE_LOGS)]} #{num}\r\n"
+                         for num in range(CHUNK_SIZE // 32)).encode()
+    sent = 0
+    while sent < size:
+        for begin in range(0, len(sample), CHUNK_SIZE):
+            chunk = sample[begin:begin + CHUNK_SIZE]
+            yield chunk
+            sent += len(chunk)
+            if sent >= size:
+                return
+
+
+def percentiles(samples: list):
+    samples = sorted(samples)
+    if not samples:
+        return 'no samples'
+    values = [samples[min(len(samples) - 1, int(len(samples) * p / 100))]
+              for p in [50, 90, 99]]
+    values.append(samples[-1])
+    return '  '.join(f"{name} {value * 1000:8.3f} ms"
+                     for name, value in zip(['p50', 'p90', 'p99', 'max'], values))
+
+
+def measure_op(name: str, func, *args, repeat: int = 20):
+    samples = list()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        samples.append(time.perf_counter() - start)
+    print(f"  {name:<20} {percentiles(samples)}")
+
+
+def ingest(logs_monitor: LogsMonitor, reader: SerialReader):
+    lines_count = 0
+    renders = list()
+    start = time.perf_counter()
+    while True:
+        logs_monitor.pull()
+        try:
+            logs = reader.read_logs(.01)
+        except serial.serialutil.SerialException:
+            break
+        for source, log, stamp, prefix, device_time in logs:
+            logs_monitor.on_log(log, source, stamp, prefix, device_time)
+        lines_count += len(logs)
+        render_start = time.perf_counter()
+        last_render = logs_monitor.last_render
+        logs_monitor.render()
+        if logs_monitor.last_render != last_render:
+            renders.append(time.perf_counter() - render_start)
+        logs_monitor.tick()
+    return lines_count, time.perf_counter() - start, renders
+
+
+def bench_monitor(config: dict, size: int, source: str, replay: str, rows: int, cols: int):
+    print(f"Monitor ({size / 1024 / 1024:.0f} MB, {source}, {rows}x{cols}):")
+    chunks = generate_chunks(size, replay)
+    port = FakePort(chunks) if source == 'fake' else PtyPort(chunks)
+    reader = SerialReader([port], config.get('queue_size', 100000), [LogsDecoder()])
+    port.reader = reader
+    reader.start()
+
+    with tempfile.TemporaryDirectory() as logs_dir:
+        logs_monitor = LogsMonitor(FakeWindow(rows, cols), config, logs_dir, reader)
+        logs_monitor.refresh()
+        lines_count, elapsed, renders = ingest(logs_monitor, reader)
+        logs_file = logs_monitor.views[0].logs_file
+        print(f"  ingest {lines_count / elapsed:12.0f} lines/s "
+              f"{logs_file.size / elapsed / 1024 / 1024:8.1f} MB/s "
+              f"dropped {reader.dropped} decode errors {reader.decode_errors}")
+        print(f"  {'render':<20} {percentiles(renders)}")
+
+        logs = logs_monitor.views[0]
+        measure_op('full redraw', logs._redraw)
+        measure_op('goto 50%', logs.goto, '50%')
+        measure_op('line up', logs.move_cursor, CursorMove.UP)
+        measure_op('page up', logs.move_page, CursorMove.UP)
+        measure_op('page down', logs.move_page, CursorMove.DOWN)
+        measure_op('search', logs.search, 'ERR')
+        measure_op('search missing', logs.search, 'missing', repeat=3)
+        measure_op('unhold', logs.unhold_cursor)
+        measure_op('set filter', logs.set_filter, 'WRN', repeat=1)
+        measure_op('set filter cached', logs.set_filter, 'WRN')
+        measure_op('filtered page up', logs.move_page, CursorMove.UP)
+        measure_op('clear filter', logs.set_filter, '')
+        logs_monitor.close()
+
+
+def main():
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    default_config_path = os.path.join(script_dir, "config.yaml")
+
+    parser = argparse.ArgumentParser(
+        description=textwrap.dedent("""
+        Headless benchmark of serial monitor, feeds synthetic or recorded
+        logs through monitor without serial port and terminal.
+        """),
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--config", default=default_config_path,
+                        help="Config in yaml format")
+    parser.add_argument("--sizes", type=float, nargs='+', default=[10, 100, 1024],
+                        help="Sizes of fed logs in MB")
+    parser.add_argument("--source", choices=['fake', 'pty'], default='fake',
+                        help="Feed logs through in-memory port or pty pair")
+    parser.add_argument("--replay",
+                        help="Recorded raw port output fed instead of synthetic logs")
+    parser.add_argument("--memory_size", type=float,
+                        help="Keep logs in memory ring buffer of size in MB instead of files")
+    parser.add_argument("--rows", type=int, default=50,
+                        help="Rows of fake terminal")
+    parser.add_argument("--cols", type=int, default=160,
+                        help="Cols of fake terminal")
+    args = parser.parse_args()
+
+    config = yaml.safe_load(open(args.config))
+    if args.memory_size:
+        config['memory_size'] = args.memory_size
+    with mock.patch.multiple(curses,
+                             init_pair=lambda *args: None,
+                             color_pair=lambda num: num << 8,
+                             doupdate=lambda: None):
+        for size in args.sizes:
+            bench_monitor(config, int(size * 1024 * 1024),
+                          args.source, args.replay, args.rows, args.cols)
+
+
+if __name__ == "__main__":
+    main()
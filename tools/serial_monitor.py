@@ -1,14 +1,35 @@
 #!/usr/bin/env python3
 import argparse
+import codecs
+import json
+import re
+import struct
 import textwrap
 import yaml
 import curses
 import os
+import gzip
+import io
+import shutil
+import mmap
+import threading
+import multiprocessing
+import selectors
+import signal
+import sys
+import time
+import unicodedata
 import serial
 import serial.tools.list_ports
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict, deque
+from itertools import accumulate, compress
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
 from enum import Enum
 from datetime import datetime
-from dataclasses import dataclass
+from dataclasses import dataclass, field, asdict
 
 
 @dataclass
@@ -28,10 +49,74 @@ class LogEntry():
     prefix: str
     show: bool
     colors: int
+    store: bool
+
+
+@dataclass
+class PrefixNode():
+    children: dict = field(default_factory=dict)
+    values: list = field(default_factory=list)
+    matches: list = field(default_factory=list)
 
 
 DEFAULT_COLORS = 0
 
+FILTERS_CACHE_SIZE = 8
+
+MAX_ENTRIES = 256
+
+MEMORY_SEGMENTS = 16
+MEMORY_LINE_SIZE = 25
+TRUNCATED_MARK = '…'.encode()
+
+LAYOUT_CACHE_SIZE = 1024
+TOKENS_CACHE_SIZE = 4096
+WIDTHS_BLOCK_SIZE = 256
+
+COMPRESS_CHUNK_SIZE = 1024 * 1024
+REPLAY_CHUNK_SIZE = 64 * 1024
+CAPTURE_BUFFER_SIZE = 64 * 1024
+CAPTURE_FLUSH_TIMEOUT = 1
+READER_STOP_TIMEOUT = 1
+POLL_INTERVAL = 0.01
+SEARCH_CHUNK_SIZE = 8 * 1024 * 1024
+SEARCH_DIR = 'search'
+MERGED_DIR = 'merged'
+SEARCH_FILE = re.compile(
+    r'(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d(?:\.\d{6})?)(?:\.(\d+))?\.log(?:\.gz)?')
+TIME_WIDTH = 16
+DEVICE_TIME_UNKNOWN = -1
+FRAME_MAGIC = b'\xfe'
+FRAME_WITHOUT_PREFIX = 0x80
+FRAME_TOKENIZED = 0x40
+FRAME_LEVEL_MASK = 0x3f
+FRAME_MAX_LENGTH = 256
+FRAME_VARINT_SIZE = 5
+TOKEN_STRING = ord('s')
+TOKEN_SIGNED = ord('i')
+TOKEN_UNSIGNED = ord('u')
+TOKEN_FLOAT = ord('f')
+TOKEN_DOUBLE = ord('d')
+TOKEN_BOOL = ord('b')
+TOKEN_CHAR = ord('c')
+TOKEN_TEXT = ord('z')
+FILTER_IGNORE_CASE = '(?i)'
+FILTER_TOKEN = re.compile(r'\s*(?:(\|)|(!?)(?:/((?:[^/\\]|\\.)+)/|"([^"]*)"|([^\s|]+)))')
+FILTER_LEVEL = 'level:'
+FILTER_TAG = r'(?:\[[^\]\n]*\] )?'
+ELF_SHT_PROGBITS = 1
+ELF_SHF_WRITE = 1
+ELF_SHF_ALLOC = 2
+ELF_EM_AVR = 83
+ELF_AVR_DATA_ADDRESS = 0x800000
+LEVEL_NAMES = ['TRC', 'DBG', 'INF', 'WRN', 'ERR']
+FRAME_FLAGS = bytes(map(lambda flags: flags & FRAME_LEVEL_MASK < len(LEVEL_NAMES), range(256)))
+FRAME_VARINT = re.compile(rb'[\x80-\xff]{0,4}[\x00-\x7f]')
+FRAME_HEADER = re.compile(
+    FRAME_MAGIC + b'([' + re.escape(bytes(compress(range(256), FRAME_FLAGS))) + b'])' +
+    b'(' + FRAME_VARINT.pattern + b')(' + FRAME_VARINT.pattern + b')')
+FIELD_KEY_VALUE = r'([\w.]+)=([^\s,;]+)'
+
 PREDEFINED_COLORS = {
     'black': curses.COLOR_BLACK,
     'red': curses.COLOR_RED,
@@ -50,40 +135,162 @@ class CursorMove(Enum):
     DOWN: int = -1
 
 
+class TimeFormat(Enum):
+    OFF: str = 'off'
+    ABSOLUTE: str = 'absolute'
+    DELTA: str = 'delta'
+    DEVICE: str = 'device'
+
+
+class Fsync(Enum):
+    NEVER: str = 'never'
+    FLUSH: str = 'flush'
+    LINE: str = 'line'
+
+
+@dataclass
+class FlushPolicy():
+    size: int = 64 * 1024
+    interval: float = 1
+    fsync: Fsync = Fsync.NEVER
+
+
+class PrefixTrie():
+    def __init__(self):
+        self.root = PrefixNode()
+        self.count = 0
+        self.starts = dict()
+
+    def add(self, prefix: str, value):
+        node = self.root
+        for ch in prefix:
+            node = node.children.setdefault(ch, PrefixNode())
+        node.values.append((self.count, value))
+        self.count += 1
+
+    def compile(self):
+        self._compile(self.root, list())
+        self.starts = dict()
+
+    def match(self, text: str, prefix: str = None):
+        node = self.root
+        if prefix is not None:
+            start = self.starts.get(prefix)
+            if start is None:
+                start = self.starts[prefix] = self._walk(prefix)
+            node, complete = start
+            if not complete or not node.children:
+                return node.matches
+            text = text[len(prefix):]
+        children = node.children
+        for ch in text:
+            child = children.get(ch)
+            if child is None:
+                break
+            node = child
+            children = node.children
+        return node.matches
+
+    def _walk(self, prefix: str):
+        node = self.root
+        for ch in prefix:
+            child = node.children.get(ch)
+            if child is None:
+                return node, False
+            node = child
+        return node, True
+
+    def _compile(self, node: PrefixNode, inherited: list):
+        values = sorted(inherited + node.values, key=lambda value: value[0])
+        node.matches = list(map(lambda value: value[1], values))
+        for child in node.children.values():
+            self._compile(child, values)
+
+
+@dataclass
+class Metrics():
+    lines_rate: float = 0
+    bytes_rate: float = 0
+    decode_errors: int = 0
+    queue_peak: int = 0
+    dropped: int = 0
+    render_ms: float = 0
+    render_max_ms: float = 0
+    write_us: float = 0
+    write_max_us: float = 0
+
+
 class Window():
     def __init__(self, stdscr, size: Size):
         self.stdscr = stdscr
         self.size = size
         self.pos = Pos(0, 0)
         self.visible = False
+        self.win = None
+        self.dirty = True
 
     def clear(self, colors: int = DEFAULT_COLORS):
-        spaces = ' ' * self.size.cols
-        for row in range(self.size.rows):
-            self.stdscr.addstr(self.pos.row + row,
-                               self.pos.col,
-                               spaces,
-                               curses.color_pair(colors))
+        self.win.bkgdset(' ', curses.color_pair(colors))
+        self.win.erase()
 
     def addstr(self, text: str, row: int = 0, col: int = 0, colors: int = DEFAULT_COLORS):
-        start_row = self.pos.row + row
-        start_col = self.pos.col + col
+        if self.win is None:
+            return
         max_rows = max(0, self.size.rows - row)
         max_cols = max(0, self.size.cols - col)
 
         lines = text.splitlines()[:max_rows]
         for line_num, line in enumerate(lines):
-            self.stdscr.addstr(start_row + line_num,
-                               start_col,
-                               line[:max_cols],
-                               curses.color_pair(colors))
+            try:
+                self.win.addstr(row + line_num,
+                                col,
+                                clip_text(line, max_cols),
+                                curses.color_pair(colors))
+            except curses.error:
+                pass
 
     def refresh(self, pos: Pos, visible: bool):
-        self.pos = pos
-        self.visible = visible
+        visible = bool(visible)
+        if pos != self.pos or visible != self.visible:
+            self.pos = pos
+            self.visible = visible
+            self.win = None
+        return self.draw()
 
     def resize(self, size: Size):
-        self.size = size
+        if size != self.size:
+            self.size = size
+            self.win = None
+
+    def invalidate(self):
+        self.dirty = True
+
+    def draw(self):
+        if not self.visible:
+            return False
+        if self.win is None:
+            self._create_win()
+        if self.win is None or not self.dirty:
+            return False
+        self.dirty = False
+        self._draw()
+        self.win.noutrefresh()
+        return True
+
+    def _create_win(self):
+        self.dirty = True
+        max_rows, max_cols = self.stdscr.getmaxyx()
+        rows = min(self.size.rows, max_rows - self.pos.row)
+        cols = min(self.size.cols, max_cols - self.pos.col)
+        if rows <= 0 or cols <= 0:
+            return
+        try:
+            self.win = self.stdscr.derwin(rows, cols, self.pos.row, self.pos.col)
+        except curses.error:
+            self.win = None
+
+    def _draw(self):
+        pass
 
 
 class Space(Window):
@@ -91,10 +298,8 @@ class Space(Window):
         super().__init__(stdscr, size)
         self.colors = colors
 
-    def refresh(self, pos: Pos, visible: bool):
-        super().refresh(pos, visible)
-        if visible:
-            self.clear(self.colors)
+    def _draw(self):
+        self.clear(self.colors)
 
 
 class Frame(Window):
@@ -106,18 +311,22 @@ class Frame(Window):
         self.window = window
 
     def refresh(self, pos: Pos, visible: bool):
-        super().refresh(pos, visible)
+        drawn = super().refresh(pos, visible)
+        drawn |= self.window.refresh(Pos(pos.row + 1, pos.col + 1), visible)
+        return drawn
 
-        if visible:
-            if self.borders:
-                self.add_borders()
-            else:
-                self.remove_borders()
+    def invalidate(self):
+        super().invalidate()
+        self.window.invalidate()
 
-            if self.name:
-                self.addstr(self.name, 0, 1, self.colors)
+    def _draw(self):
+        if self.borders:
+            self.add_borders()
+        else:
+            self.remove_borders()
 
-        self.window.refresh(Pos(pos.row + 1, pos.col + 1), visible)
+        if self.name:
+            self.addstr(self.name, 0, 1, self.colors)
 
     def add_borders(self, l='│', r='│', t='─', b='─', tl='┌', tr='┐', bl='└', br='┘'):
         self.addstr(f"{tl}{t * (self.size.cols - 2)}{tr}", 0, 0, self.colors)
@@ -138,11 +347,17 @@ class Row(Window):
         self.windows = windows
 
     def refresh(self, pos: Pos, visible: bool):
-        super().refresh(pos, visible)
+        drawn = super().refresh(pos, visible)
         col = pos.col
         for window in self.windows:
-            window.refresh(Pos(pos.row, col), visible)
+            drawn |= window.refresh(Pos(pos.row, col), visible)
             col += window.size.cols
+        return drawn
+
+    def invalidate(self):
+        super().invalidate()
+        for window in self.windows:
+            window.invalidate()
 
 
 class Col(Window):
@@ -152,11 +367,17 @@ class Col(Window):
         self.windows = windows
 
     def refresh(self, pos: Pos, visible: bool):
-        super().refresh(pos, visible)
+        drawn = super().refresh(pos, visible)
         row = pos.row
         for window in self.windows:
-            window.refresh(Pos(row, pos.col), visible)
+            drawn |= window.refresh(Pos(row, pos.col), visible)
             row += window.size.rows
+        return drawn
+
+    def invalidate(self):
+        super().invalidate()
+        for window in self.windows:
+            window.invalidate()
 
 
 class Label(Window):
@@ -168,29 +389,12 @@ class Label(Window):
                  wrap_around: bool):
         super().__init__(stdscr, size)
         self.colors = colors
-        self.text = text
+        self.text = layout_text(text, size.cols, wrap_around, False)
         self.wrap_around = wrap_around
-        self._format_text()
 
-    def refresh(self, pos: Pos, visible: bool):
-        super().refresh(pos, visible)
-        self._redraw()
-
-    def _format_text(self):
-        col = 0
-        formated_text = ''
-        for ch in self.text:
-            if self.wrap_around and col >= self.size.cols:
-                col = 0
-                formated_text += '\n'
-            formated_text += ch
-            col += 1
-        self.text = formated_text
-
-    def _redraw(self):
-        if self.visible:
-            self.clear(self.colors)
-            self.addstr(self.text, 0, 0, self.colors)
+    def _draw(self):
+        self.clear(self.colors)
+        self.addstr(self.text, 0, 0, self.colors)
 
 
 class Status(Window):
@@ -202,7 +406,9 @@ class Status(Window):
                  colors: int,
                  initial: str,
                  wrap_around: bool,
-                 insert_spaces: bool):
+                 insert_spaces: bool,
+                 field: str = None,
+                 interval: float = 0):
         super().__init__(stdscr, size)
         self.prefix = prefix
         self.show_prefix = show_prefix
@@ -210,197 +416,907 @@ class Status(Window):
         self.log = initial
         self.wrap_around = wrap_around
         self.insert_spaces = insert_spaces
+        self.field = field
+        self.interval = interval
+        self.last_draw = 0
         self._old_log = initial
 
-    def refresh(self, pos: Pos, visible: bool):
-        super().refresh(pos, visible)
-        self._redraw()
+    @property
+    def waiting(self):
+        return self.dirty and self.visible and self.win is not None
 
     def on_log(self, log: str):
-        if log.startswith(self.prefix):
-            self.log = log if self.show_prefix else log[len(self.prefix):]
-            self._format_log()
-            if self._old_log != self.log:
-                self._old_log = self.log
-                self._redraw()
+        self.on_field(log if self.show_prefix else log[len(self.prefix):])
 
-    def _format_log(self):
-        col = 0
-        formated_log = ''
-        for ch in self.log:
-            if self.wrap_around and col >= self.size.cols:
-                col = 0
-                formated_log += '\n'
-            formated_log += ch
-            col += 1
-            if self.insert_spaces:
-                if self.wrap_around and col >= self.size.cols:
-                    col = 0
-                    formated_log += '\n'
-                else:
-                    formated_log += ' '
-                    col += 1
-        self.log = formated_log
+    def on_field(self, value: str):
+        if self._old_log != value:
+            self._old_log = value
+            self.log = layout_text(value, self.size.cols, self.wrap_around, self.insert_spaces)
+            self.dirty = True
 
-    def _redraw(self):
-        if self.visible:
-            self.clear(self.colors)
-            self.addstr(self.log, 0, 0, self.colors)
+    def render(self):
+        now = time.monotonic()
+        if self.dirty and now - self.last_draw < self.interval:
+            return
+        if self.draw():
+            self.last_draw = now
+
+    def _draw(self):
+        self.clear(self.colors)
+        self.addstr(self.log, 0, 0, self.colors)
+
+
+class MetricsView(Window):
+    def __init__(self, stdscr, size: Size, colors: int, inline: bool):
+        super().__init__(stdscr, size)
+        self.colors = colors
+        self.inline = inline
+        self.metrics = Metrics()
+
+    def set_metrics(self, metrics: Metrics):
+        if metrics != self.metrics:
+            self.metrics = metrics
+            self.dirty = True
+
+    def _format_metrics(self):
+        metrics = self.metrics
+        return [
+            ('lines/s', f"{metrics.lines_rate:.0f}"),
+            ('KB/s', f"{metrics.bytes_rate / 1024:.1f}"),
+            ('decode errors', f"{metrics.decode_errors}"),
+            ('queue peak', f"{metrics.queue_peak}"),
+            ('dropped', f"{metrics.dropped}"),
+            ('render ms', f"{metrics.render_ms:.2f}/{metrics.render_max_ms:.2f}"),
+            ('write us', f"{metrics.write_us:.1f}/{metrics.write_max_us:.1f}")]
+
+    def _draw(self):
+        self.clear(self.colors)
+        items = self._format_metrics()
+        if self.inline:
+            text = '  '.join(map(lambda item: f"{item[0]} {item[1]}", items))
+        else:
+            width = max(map(lambda item: len(item[0]), items)) + 1
+            text = '\n'.join(map(lambda item: f"{item[0].ljust(width)}{item[1]}", items))
+        self.addstr(text, 0, 0, self.colors)
+
+
+@dataclass
+class FilterTerm():
+    pattern: str
+    finder: str
+    negated: bool = False
+    anchored: bool = False
+    literal: str = None
+
+
+class LogsFilter():
+    def __init__(self, expression: str):
+        self.expression = expression
+        flags = re.MULTILINE | re.ASCII
+        if expression.startswith(FILTER_IGNORE_CASE):
+            expression = expression[len(FILTER_IGNORE_CASE):]
+            flags |= re.IGNORECASE
+        groups = self._parse(expression)
+        self.literal = None
+        self.regex = None
+        self.finder_exact = False
+        if not groups:
+            self.literal = ''
+        elif len(groups) == 1 and len(groups[0]) == 1 and groups[0][0].literal is not None \
+                and not groups[0][0].negated and not flags & re.IGNORECASE:
+            self.literal = groups[0][0].literal
+        else:
+            pattern = '^(?:' + '|'.join(map(
+                lambda terms: ''.join(map(self._lookahead, terms)), groups)) + ')'
+            self.text_regex = re.compile(pattern, flags)
+            self.regex = re.compile(pattern.encode(), flags)
+            finders = list(map(self._finder, groups))
+            if None in finders:
+                self.text_finder = None
+                self.finder = self.regex
+            else:
+                finder = '|'.join(map(lambda pattern: f"(?:{pattern})", finders))
+                self.text_finder = re.compile(finder, flags)
+                self.finder = re.compile(finder.encode(), flags)
+                self.finder_exact = all(map(lambda terms: len(terms) == 1 and
+                                            not terms[0].negated and
+                                            terms[0].literal is not None,
+                                            groups))
+        self.literal_bytes = self.literal.encode() if self.literal is not None else None
+
+    @property
+    def exact(self):
+        return self.regex is None or self.finder_exact
+
+    def match(self, log: str):
+        if self.regex is None:
+            return self.literal in log
+        if self.text_finder is not None and self.text_finder.search(log) is None:
+            return False
+        return self.finder_exact or self.text_regex.match(log) is not None
+
+    def find(self, data, pos: int, end: int):
+        if self.regex is None:
+            return data.find(self.literal_bytes, pos, end)
+        match = self.finder.search(data, pos, end)
+        return match.start() if match else -1
+
+    def contains(self, data, begin: int, end: int):
+        if self.regex is None:
+            return data.find(self.literal_bytes, begin, end) >= 0
+        return self.regex.match(data, begin, end) is not None
+
+    def _parse(self, expression: str):
+        groups = list()
+        terms = list()
+        pos = 0
+        while True:
+            token = FILTER_TOKEN.match(expression, pos)
+            if token is None:
+                break
+            pos = token.end()
+            alternative, negation, regex, quoted, word = token.groups()
+            if alternative:
+                if terms:
+                    groups.append(terms)
+                terms = list()
+            elif regex is not None:
+                terms.append(FilterTerm(regex, regex, bool(negation)))
+            elif quoted is not None:
+                terms.append(FilterTerm(re.escape(quoted), re.escape(quoted), bool(negation),
+                                        literal=quoted))
+            elif word.startswith(FILTER_LEVEL) and len(word) > len(FILTER_LEVEL):
+                names = self._level_names(word[len(FILTER_LEVEL):])
+                terms.append(FilterTerm(FILTER_TAG + names, names, bool(negation), True))
+            else:
+                terms.append(FilterTerm(re.escape(word), re.escape(word), bool(negation),
+                                        literal=word))
+        if terms:
+            groups.append(terms)
+        return groups
+
+    def _level_names(self, levels: str):
+        names = list()
+        for level in levels.split(','):
+            if level.endswith('+') and level[:-1] in LEVEL_NAMES:
+                names += LEVEL_NAMES[LEVEL_NAMES.index(level[:-1]):]
+            else:
+                names.append(level)
+        return '(?:' + '|'.join(map(re.escape, names)) + ')'
+
+    def _finder(self, terms: list):
+        terms = list(filter(lambda term: not term.negated, terms))
+        literals = list(filter(lambda term: term.literal is not None, terms))
+        if literals:
+            return max(literals, key=lambda term: len(term.literal)).finder
+        return terms[0].finder if terms else None
+
+    def _lookahead(self, term: FilterTerm):
+        pattern = term.pattern if term.anchored else f"[^\\n]*(?:{term.pattern})"
+        return f"(?!{pattern})" if term.negated else f"(?={pattern})"
+
+
+class FieldPattern():
+    def __init__(self, prefix: str, pattern: str):
+        self.prefix = prefix
+        self.regex = re.compile(pattern)
+        self.named = bool(self.regex.groupindex)
+        if not self.named and self.regex.groups != 2:
+            raise ValueError(
+                f"Field pattern needs named groups or key and value groups\n {pattern}")
+
+    def parse(self, log: str):
+        if not self.named:
+            return self.regex.findall(log, len(self.prefix))
+        match = self.regex.search(log, len(self.prefix))
+        if match is None:
+            return []
+        return list(filter(lambda item: item[1] is not None, match.groupdict().items()))
+
+
+class LogsSegment():
+    def __init__(self, first_line: int):
+        self.first_line = first_line
+        self.index = array('Q')
+        self.times = array('Q')
+        self.device_times = array('q')
+        self.entries = bytearray()
+        self.size = 0
+        self.created = time.monotonic()
+
+    def flush(self):
+        pass
+
+    def flush_if_due(self):
+        pass
+
+    def flush_delay(self):
+        return None
+
+    def data(self):
+        return b''
+
+    def release(self):
+        pass
+
+    def finish(self):
+        pass
+
+    def poll_compression(self):
+        return True
+
+    def save_index(self, clock_offset: int):
+        pass
+
+    def close(self):
+        pass
+
+    def remove(self):
+        pass
+
+    def line_begin(self, line_num: int):
+        return self.index[line_num]
+
+    def line_end(self, line_num: int):
+        if line_num + 1 < len(self.index):
+            return self.index[line_num + 1] - len('\n')
+        return self.size
+
+    def line_num(self, pos: int):
+        return bisect_right(self.index, pos) - 1
+
+    def read_range(self, data, begin: int, end: int):
+        if begin >= end:
+            return []
+        lines = data[self.line_begin(begin):self.line_end(end - 1)].split(b'\n')
+        return [line.decode() for line in lines]
+
+    def contains(self, data, line_num: int, matcher: LogsFilter):
+        return matcher.contains(data, self.line_begin(line_num), self.line_end(line_num))
+
+    def find_line(self,
+                  data,
+                  text: LogsFilter,
+                  filter: LogsFilter,
+                  hidden: frozenset,
+                  begin: int,
+                  end: int):
+        if begin >= end:
+            return -1
+        pos = self.line_begin(begin)
+        end_pos = self.line_end(end - 1)
+        while True:
+            pos = text.find(data, pos, end_pos)
+            if pos < 0:
+                return -1
+            line_num = self.line_num(pos)
+            if line_num < 0:
+                return -1
+            if (text.exact or self.contains(data, line_num, text)) and \
+                    self.contains(data, line_num, filter) and \
+                    self.entries[line_num] not in hidden:
+                return line_num
+            if line_num + 1 >= end:
+                return -1
+            pos = self.line_begin(line_num + 1)
+
+    def find_lines(self, data, matcher: LogsFilter, hidden: frozenset = frozenset()):
+        if not self.index:
+            return
+        pos = 0
+        while True:
+            pos = matcher.find(data, pos, self.size)
+            if pos < 0:
+                return
+            line_num = self.line_num(pos)
+            if (matcher.exact or self.contains(data, line_num, matcher)) and \
+                    self.entries[line_num] not in hidden:
+                yield line_num
+            if line_num + 1 >= len(self.index):
+                return
+            pos = self.line_begin(line_num + 1)
+
+    def visible_lines(self, hidden: frozenset):
+        visible = self.entries.translate(bytes(map(lambda entry: entry not in hidden,
+                                                   range(MAX_ENTRIES))))
+        return compress(range(len(self.index)), visible)
+
+    def count_entries(self, begin: int, end: int, entries_count: int):
+        return list(map(lambda entry: self.entries.count(entry, begin, end), range(entries_count)))
+
+    def _add_line(self, begin: int, size: int, stamp: int, entry: int, device_time: int):
+        self.index.append(begin)
+        self.times.append(stamp)
+        self.device_times.append(device_time)
+        self.entries.append(entry)
+        self.size = begin + size
+
+
+class FileSegment(LogsSegment):
+    def __init__(self, path: str, first_line: int, flush_policy: FlushPolicy):
+        super().__init__(first_line)
+        self.path = path
+        self.flush_policy = flush_policy
+        self.writer = open(path, 'ab', buffering=max(io.DEFAULT_BUFFER_SIZE, flush_policy.size))
+        self.reader = open(path, 'rb')
+        self.map = None
+        self.flushed = 0
+        self.last_flush = self.created
+        self.compressor = None
+        self.packed = False
+        self.compressed = False
+        self.unpacked = None
+
+    def write_line(self, data: bytes, stamp: int, entry: int, device_time: int):
+        begin = self.size + len('\n') if self.index else 0
+        if self.index:
+            self.writer.write(b'\n')
+        self.writer.write(data)
+        self._add_line(begin, len(data), stamp, entry, device_time)
+        if self.flush_policy.fsync == Fsync.LINE or \
+                self.size - self.flushed >= self.flush_policy.size:
+            self.flush()
+
+    def flush(self):
+        self.writer.flush()
+        if self.flush_policy.fsync != Fsync.NEVER:
+            os.fsync(self.writer.fileno())
+        self.flushed = self.size
+        self.last_flush = time.monotonic()
+
+    def flush_if_due(self):
+        if self.flushed < self.size and \
+                time.monotonic() - self.last_flush >= self.flush_policy.interval:
+            self.flush()
+
+    def flush_delay(self):
+        if self.flushed == self.size:
+            return None
+        return self.last_flush + self.flush_policy.interval - time.monotonic()
+
+    def data(self):
+        if self.compressor is not None and not self.compressor.is_alive():
+            self._finish_compression()
+        if self.compressed:
+            if self.unpacked is None:
+                with gzip.open(f"{self.path}.gz", 'rb') as packed_file:
+                    self.unpacked = packed_file.read()
+            return self.unpacked
+        if not self.size:
+            return b''
+        if self.writer is not None and self.flushed < self.size:
+            self.flush()
+        if self.map is None or len(self.map) < self.size:
+            if self.map is not None:
+                self.map.close()
+            if self.reader is None:
+                self.reader = open(self.path, 'rb')
+            self.map = mmap.mmap(self.reader.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.map
+
+    def release(self):
+        self.unpacked = None
+        if self.writer is None and self.compressor is None:
+            self._close_files()
+
+    def compress(self):
+        self.flush()
+        self.compressor = threading.Thread(target=self._compress, daemon=True)
+        self.compressor.start()
+
+    def finish(self):
+        self.flush()
+        self.writer.close()
+        self.writer = None
+        if self.compressor is None:
+            self._close_files()
+
+    def poll_compression(self):
+        if self.compressor is not None and not self.compressor.is_alive():
+            self._finish_compression()
+        return self.compressor is None
+
+    def save_index(self, clock_offset: int):
+        with open(f"{os.path.splitext(self.path)[0]}.idx", 'wb') as index_file:
+            self.index.tofile(index_file)
+        with open(f"{os.path.splitext(self.path)[0]}.ts", 'wb') as times_file:
+            array('Q', map(lambda stamp: stamp + clock_offset, self.times)).tofile(times_file)
+        with open(f"{os.path.splitext(self.path)[0]}.ent", 'wb') as entries_file:
+            entries_file.write(self.entries)
+
+    def close(self):
+        if self.compressor is not None:
+            self._finish_compression()
+        if self.writer is not None:
+            self.flush()
+        self._close_files()
+
+    def remove(self):
+        self.close()
+        name = os.path.splitext(self.path)[0]
+        for path in [self.path, f"{self.path}.gz", f"{name}.idx", f"{name}.ts", f"{name}.ent"]:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _compress(self):
+        packed_path = f"{self.path}.gz"
+        try:
+            with open(self.path, 'rb') as log_file, \
+                    open(f"{packed_path}.tmp", 'wb') as packed_file:
+                with gzip.GzipFile(self.path, 'wb', fileobj=packed_file) as gzip_file:
+                    shutil.copyfileobj(log_file, gzip_file, COMPRESS_CHUNK_SIZE)
+                packed_file.flush()
+                os.fsync(packed_file.fileno())
+            os.replace(f"{packed_path}.tmp", packed_path)
+        except OSError:
+            if os.path.exists(f"{packed_path}.tmp"):
+                os.remove(f"{packed_path}.tmp")
+            return
+        self.packed = True
+        os.remove(self.path)
+
+    def _finish_compression(self):
+        self.compressor.join()
+        self.compressor = None
+        self._close_files()
+        self.compressed = self.packed
+
+    def _close_files(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        if self.reader is not None:
+            self.reader.close()
+            self.reader = None
+
+
+class MemorySegment(LogsSegment):
+    def __init__(self, capacity: int, first_line: int, buffer: bytearray = None):
+        super().__init__(first_line)
+        self.capacity = capacity
+        self.buffer = buffer if buffer is not None else bytearray()
+
+    def fits(self, size: int):
+        return self.size + len('\n') + size + (len(self.index) + 1) * MEMORY_LINE_SIZE <= \
+            self.capacity
+
+    def write_line(self, data: bytes, stamp: int, entry: int, device_time: int):
+        begin = self.size + len('\n') if self.index else 0
+        free = self.capacity - begin - (len(self.index) + 1) * MEMORY_LINE_SIZE
+        if len(data) > free:
+            data = data[:max(0, free - len(TRUNCATED_MARK))].decode(errors='ignore').encode() + \
+                TRUNCATED_MARK
+        if self.index:
+            self.buffer[self.size:begin] = b'\n'
+        self.buffer[begin:begin + len(data)] = data
+        self._add_line(begin, len(data), stamp, entry, device_time)
+
+    def data(self):
+        return self.buffer
+
+    def remove(self):
+        self.buffer = bytearray()
 
 
 class LogsFile():
-    def __init__(self, logs_dir: str):
-        os.makedirs(logs_dir, exist_ok=True)
-        self.file = open(os.path.join(
-            logs_dir, f"{datetime.now()}.log"), 'bw+')
-        self.buffer = list()
+    def __init__(self,
+                 logs_dir: str,
+                 save_index: bool = False,
+                 segment_size: int = 0,
+                 segment_duration: float = 0,
+                 max_segments: int = 0,
+                 compress_segments: bool = False,
+                 flush_policy: FlushPolicy = FlushPolicy(),
+                 memory_size: int = 0,
+                 spill_on_stop: bool = False):
+        if spill_on_stop and not memory_size:
+            raise ValueError("spill_on_stop needs memory_size")
+        if not memory_size or spill_on_stop:
+            os.makedirs(logs_dir, exist_ok=True)
+        self.logs_dir = logs_dir
+        self.session = f"{datetime.now()}"
+        self.clock_offset = time.time_ns() - time.monotonic_ns()
+        self.save_index = save_index
+        self.segment_size = segment_size
+        self.segment_duration = segment_duration
+        self.max_segments = max_segments
+        self.compress_segments = compress_segments
+        self.flush_policy = flush_policy
+        self.memory_size = memory_size
+        if memory_size:
+            self.segment_size = 0
+            self.segment_duration = 0
+            self.max_segments = MEMORY_SEGMENTS - 1
+            self.compress_segments = False
+        self.spill_on_stop = spill_on_stop
+        self.spill_file = None
+        self.spilled = 0
+        self.segments = list()
+        self.segments_count = 0
+        self.spare_buffer = None
+        self.compressing = list()
+        self.first_lines = list()
+        self.unpacked = None
+        self.lines_count = 0
+        self.size = 0
+        self.write_time = 0
+        self.write_time_max = 0
+        self.cursor = 0
+        self.buffer = deque()
         self.buffer_size = 0
         self.filter = ''
+        self.hidden = frozenset()
+        self.selection = (self.filter, self.hidden)
+        self.matcher = LogsFilter('')
+        self.matches = OrderedDict()
+        self.matchers = dict()
         self.held = False
-
-    def write_log(self, log: str):
-        pos = self.file.tell()
-        self.file.seek(0, os.SEEK_END)
-        self._write_line(log)
-        if self.held:
-            self.file.seek(pos)
-        elif self.filter in log:
-            self.buffer.append(log)
-            if len(self.buffer) > self.buffer_size:
-                self.buffer.pop(0)
+        self._add_segment()
+
+    @property
+    def first_line(self):
+        return self.segments[0].first_line
+
+    @property
+    def filtered(self):
+        return bool(self.filter or self.hidden)
+
+    def write_log(self, log: str, stamp: int = None, entry: int = 0, device_time: int = None):
+        start = time.perf_counter_ns()
+        data = log.encode()
+        segment = self.segments[-1]
+        if self._should_rotate(segment, len(data)):
+            segment = self._rotate()
+
+        segment_size = segment.size
+        segment.write_line(data,
+                           stamp if stamp is not None else time.monotonic_ns(),
+                           entry,
+                           device_time if device_time is not None else DEVICE_TIME_UNKNOWN)
+        self.size += segment.size - segment_size
+        self.lines_count += 1
+        write_time = time.perf_counter_ns() - start
+        self.write_time += write_time
+        self.write_time_max = max(self.write_time_max, write_time)
+
+        for selection, matches in self.matches.items():
+            if entry not in selection[1] and self.matchers[selection].match(log):
+                matches.append(self.lines_count - 1)
+        if not self.held:
+            self.cursor = self.lines_count
+            if entry not in self.hidden and self.matcher.match(log):
+                self.buffer.append(log)
+                if len(self.buffer) > self.buffer_size:
+                    self.buffer.popleft()
+                return True
+        return False
 
     def read_logs(self, size: int):
         if self.buffer_size != size:
             self.buffer_size = size
-            self._update_buffer()
+            while len(self.buffer) > size:
+                self.buffer.popleft()
+            self._fill_buffer()
         return self.buffer
 
+    def read_times(self, size: int, device: bool = False):
+        if not self.filtered:
+            begin = max(self.first_line, self.cursor - size)
+            lines = range(begin, self.cursor)
+        else:
+            matches = self.matches[self.selection]
+            end = bisect_left(matches, self.cursor)
+            lines = matches[max(0, end - size):end]
+        return list(map(lambda line_num: self._line_time(line_num, device), lines))
+
     def set_filter(self, filter: str):
-        self.filter = filter
-        self._update_buffer()
+        self._select(LogsFilter(filter), filter, self.hidden)
+
+    def set_hidden(self, hidden: frozenset):
+        self._select(self.matcher, self.filter, hidden)
+
+    def count_entries(self, begin: int, end: int, entries_count: int):
+        counts = [0] * entries_count
+        while begin < end:
+            segment = self.segments[self._segment_num(begin)]
+            segment_end = min(end, segment.first_line + len(segment.index))
+            segment_counts = segment.count_entries(begin - segment.first_line,
+                                                   segment_end - segment.first_line,
+                                                   entries_count)
+            counts = list(map(sum, zip(counts, segment_counts)))
+            begin = segment_end
+        return counts
 
     def search(self, text: str):
-        pos = self.file.tell()
-
-        next_pos = pos
-        self.file.seek(0, os.SEEK_END)
-        eof_pos = self.file.tell()
-        next_pos += min(len('\n'), next_pos)
-        next_pos = min(eof_pos, next_pos)
-        for line in self._read_lines(next_pos, eof_pos):
-            next_pos += len(line)
-            if self.filter in line and text in line:
-                self.file.seek(next_pos)
-                self._update_buffer()
-                return
-            next_pos += len('\n')
-        next_pos = 0
-        for line in self._read_lines(next_pos, pos):
-            next_pos += len(line)
-            if self.filter in line and text in line:
-                self.file.seek(next_pos)
-                self._update_buffer()
-                return
-            next_pos += len('\n')
-
-        self.file.seek(next_pos)
+        matcher = LogsFilter(text)
+        self.hold_cursor()
+        line_num = self._find_line(matcher, self.cursor, self.lines_count)
+        if line_num < 0:
+            line_num = self._find_line(matcher, self.first_line, self.cursor)
+        if line_num >= 0:
+            self._set_cursor(line_num + 1)
 
     def hold_cursor(self):
+        if not self.held and self.spill_on_stop:
+            self.spill()
         self.held = True
 
     def unhold_cursor(self):
         self.held = False
-        self.file.seek(0, os.SEEK_END)
-        self._update_buffer()
+        self._set_cursor(self.lines_count)
 
-    def move_cursor(self, move: CursorMove):
+    def move_cursor(self, move: CursorMove, count: int = 1):
         self.hold_cursor()
-        pos = self.file.tell()
 
+        if not self.filtered:
+            if move == CursorMove.DOWN:
+                self._set_cursor(min(self.lines_count, self.cursor + count))
+            elif move == CursorMove.UP:
+                self._set_cursor(max(min(self.first_line + 1, self.cursor), self.cursor - count))
+            return
+
+        matches = self.matches[self.selection]
         if move == CursorMove.DOWN:
-            self.file.seek(0, os.SEEK_END)
-            eof_pos = self.file.tell()
-            pos += min(len('\n'), pos)
-            pos = min(eof_pos, pos)
-            for line in self._read_lines(pos, eof_pos):
-                pos += len(line)
-                if self.filter in line:
-                    self.file.seek(pos)
-                    self._update_buffer()
-                    return
-                pos += len('\n')
+            match_num = bisect_left(matches, self.cursor)
+            if match_num < len(matches):
+                self._set_cursor(matches[min(len(matches), match_num + count) - 1] + 1)
         elif move == CursorMove.UP:
-            for line in self._read_lines_reverse(pos):
-                pos -= len(line) + len('\n')
-                pos = max(0, pos)
-                if self.filter in line:
-                    self.file.seek(pos)
-                    self._update_buffer()
-                    return
+            match_num = bisect_left(matches, self.cursor) - 1
+            if match_num > 0:
+                self._set_cursor(matches[max(0, match_num - count)] + 1)
+
+    def goto_line(self, line_num: int):
+        self.hold_cursor()
+        first_line = min(self.first_line + 1, self.lines_count)
+        self._set_cursor(max(first_line, min(self.lines_count, line_num)))
+
+    def goto_percentage(self, percentage: float):
+        lines_count = self.lines_count - self.first_line
+        self.goto_line(self.first_line + round(lines_count * percentage / 100))
+
+    def flush(self):
+        self.segments[-1].flush()
+
+    def flush_if_due(self):
+        if self.compressing:
+            self._poll_compressions()
+        self.segments[-1].flush_if_due()
+
+    def flush_delay(self):
+        return self.segments[-1].flush_delay()
+
+    def spill(self):
+        begin = max(self.spilled, self.first_line)
+        if begin >= self.lines_count:
+            return
+        if self.spill_file is None:
+            self.spill_file = open(os.path.join(self.logs_dir, f"{self.session}.spill.log"), 'ab')
+        for segment in self.segments[self._segment_num(begin):]:
+            line_num = max(0, begin - segment.first_line)
+            if line_num >= len(segment.index):
+                continue
+            data = self._segment_data(segment)
+            if self.spill_file.tell():
+                self.spill_file.write(b'\n')
+            self.spill_file.write(data[segment.line_begin(line_num):segment.size])
+        self.spill_file.flush()
+        self.spilled = self.lines_count
+
+    def open_capture(self):
+        os.makedirs(self.logs_dir, exist_ok=True)
+        return open(os.path.join(self.logs_dir, f"{self.session}.raw"), 'ab',
+                    buffering=CAPTURE_BUFFER_SIZE)
+
+    def close(self):
+        for segment in self.segments:
+            if self.save_index:
+                segment.save_index(self.clock_offset)
+            segment.close()
+        if self.spill_file is not None:
+            self.spill_file.close()
+
+    def remove(self):
+        for segment in self.segments:
+            segment.remove()
+        if self.spill_file is not None:
+            self.spill_file.close()
+
+    def _select(self, matcher: LogsFilter, filter: str, hidden: frozenset):
+        self.matcher = matcher
+        self.filter = filter
+        self.hidden = hidden
+        self.selection = (filter, hidden)
+        if self.filtered:
+            self._cache_matches(self.selection)
+        self._update_buffer()
+
+    def _set_cursor(self, cursor: int):
+        self.cursor = cursor
+        self._update_buffer()
 
     def _update_buffer(self):
         self.buffer.clear()
+        self._fill_buffer()
+
+    def _fill_buffer(self):
+        missing = self.buffer_size - len(self.buffer)
+        if not self.filtered:
+            end = self.cursor - len(self.buffer)
+            begin = max(self.first_line, end - missing)
+            self.buffer.extendleft(reversed(self._read_range(begin, end)))
+            return
 
-        pos = self.file.tell()
+        matches = self.matches[self.selection]
+        end = bisect_left(matches, self.cursor) - len(self.buffer)
+        self.buffer.extendleft(reversed(list(map(
+            lambda line_num: self._read_range(line_num, line_num + 1)[0],
+            matches[max(0, end - missing):end]))))
 
-        for log in self._read_lines_reverse(pos):
-            if self.filter in log:
-                self.buffer.insert(0, log)
-            if len(self.buffer) >= self.buffer_size:
-                break
+    def _cache_matches(self, selection: tuple):
+        if selection in self.matches:
+            self.matches.move_to_end(selection)
+            return
 
-        self.file.seek(pos)
-
-    def _write_line(self, line: str):
-        if self.file.tell():
-            line = f"\n{line}"
-        self.file.write(line.encode())
-
-    def _read_lines(self, begin: int, end: int):
-        pointer_location = begin
-        buffer = bytearray()
-        while pointer_location < end:
-            self.file.seek(pointer_location)
-            pointer_location += 1
-            new_byte = self.file.read(1)
-            if new_byte == b'\n':
-                yield buffer.decode()
-                buffer = bytearray()
-            else:
-                buffer.extend(new_byte)
-        if len(buffer) > 0:
-            yield buffer.decode()
-
-    def _read_lines_reverse(self, begin: int, end: int = 0):
-        pointer_location = begin - 1
-        buffer = bytearray()
-        while pointer_location >= end:
-            self.file.seek(pointer_location)
-            pointer_location -= 1
-            new_byte = self.file.read(1)
-            if new_byte == b'\n':
-                yield buffer.decode()[::-1]
-                buffer = bytearray()
+        matches = array('Q')
+        for segment in self.segments:
+            if self.filter:
+                lines = segment.find_lines(self._segment_data(segment), self.matcher, self.hidden)
             else:
-                buffer.extend(new_byte)
-        if len(buffer) > 0:
-            yield buffer.decode()[::-1]
+                lines = segment.visible_lines(self.hidden)
+            matches.extend(map(lambda line_num: segment.first_line + line_num, lines))
+
+        self.matches[selection] = matches
+        self.matchers[selection] = self.matcher
+        if len(self.matches) > FILTERS_CACHE_SIZE:
+            del self.matchers[self.matches.popitem(last=False)[0]]
+
+    def _should_rotate(self, segment: LogsSegment, size: int):
+        if not segment.index:
+            return False
+        if self.memory_size and not segment.fits(size):
+            return True
+        if self.segment_size and segment.size >= self.segment_size:
+            return True
+        if self.segment_duration and time.monotonic() - segment.created >= self.segment_duration:
+            return True
+        return False
+
+    def _rotate(self):
+        segment = self.segments[-1]
+        segment.flush()
+        if self.save_index:
+            segment.save_index(self.clock_offset)
+        if self.compress_segments:
+            segment.compress()
+            self.compressing.append(segment)
+        segment.finish()
+        if self.compressing:
+            self._poll_compressions()
+
+        self._add_segment()
+        while self.max_segments and len(self.segments) > self.max_segments:
+            self._remove_segment()
+        return self.segments[-1]
+
+    def _add_segment(self):
+        name = self.session
+        if self.segments_count:
+            name = f"{name}.{self.segments_count}"
+        self.segments_count += 1
+        if self.memory_size:
+            segment = MemorySegment(self.memory_size // MEMORY_SEGMENTS,
+                                    self.lines_count,
+                                    self.spare_buffer)
+            self.spare_buffer = None
+        else:
+            segment = FileSegment(os.path.join(self.logs_dir, f"{name}.log"),
+                                  self.lines_count,
+                                  self.flush_policy)
+        self.segments.append(segment)
+        self.first_lines.append(segment.first_line)
+
+    def _poll_compressions(self):
+        self.compressing = list(filter(lambda segment: not segment.poll_compression(),
+                                       self.compressing))
+
+    def _remove_segment(self):
+        segment = self.segments.pop(0)
+        self.first_lines.pop(0)
+        if self.unpacked is segment:
+            self.unpacked = None
+        if self.memory_size:
+            self.spare_buffer = segment.buffer
+        segment.remove()
+
+        for matches in self.matches.values():
+            del matches[:bisect_left(matches, self.first_line)]
+        self._set_cursor(max(self.cursor, self.first_line))
+
+    def _line_time(self, line_num: int, device: bool = False):
+        segment = self.segments[self._segment_num(line_num)]
+        times = segment.device_times if device else segment.times
+        return times[line_num - segment.first_line]
+
+    def _segment_num(self, line_num: int):
+        return max(0, bisect_right(self.first_lines, line_num) - 1)
+
+    def _segment_data(self, segment: LogsSegment):
+        data = segment.data()
+        if segment is not self.segments[-1] and self.unpacked is not segment:
+            if self.unpacked is not None:
+                self.unpacked.release()
+            self.unpacked = segment
+        return data
+
+    def _read_range(self, begin: int, end: int):
+        logs = list()
+        while begin < end:
+            segment = self.segments[self._segment_num(begin)]
+            segment_end = min(end, segment.first_line + len(segment.index))
+            logs.extend(segment.read_range(self._segment_data(segment),
+                                           begin - segment.first_line,
+                                           segment_end - segment.first_line))
+            begin = segment_end
+        return logs
+
+    def _find_line(self, text: LogsFilter, begin: int, end: int):
+        for segment in self.segments[self._segment_num(begin):]:
+            if segment.first_line >= end:
+                break
+            line_num = segment.find_line(self._segment_data(segment),
+                                         text,
+                                         self.matcher,
+                                         self.hidden,
+                                         max(0, begin - segment.first_line),
+                                         min(len(segment.index), end - segment.first_line))
+            if line_num >= 0:
+                return segment.first_line + line_num
+        return -1
 
 
 class Logs(Window):
-    def __init__(self, stdscr, logs_file: LogsFile, entries: list, show_prefix: bool):
+    def __init__(self,
+                 stdscr,
+                 logs_file: LogsFile,
+                 entries: list,
+                 show_prefix: bool,
+                 name: str = '',
+                 tagged: bool = False,
+                 time_format: TimeFormat = TimeFormat.OFF):
         super().__init__(stdscr, Size(0, 0))
+        self.name = name
+        self.tagged = tagged
+        self.time_format = time_format
         self.entries = entries
+        self.entries_trie = PrefixTrie()
+        for entry_num in range(len(entries)):
+            self.entries_trie.add(entries[entry_num].prefix, entry_num)
+        self.entries_trie.compile()
         self.logs_file = logs_file
+        self.logs_file.set_hidden(self._hidden_entries())
         self.show_prefix = show_prefix
-
-    def refresh(self, pos: Pos, visible: bool):
-        super().refresh(pos, visible)
-        self._redraw()
-
-    def on_log(self, log: str):
-        if self._should_show_log(log):
-            self.logs_file.write_log(log)
+        self.new_rows = 0
+
+    def on_log(self,
+               log: str,
+               tag: str = '',
+               stamp: int = None,
+               prefix: str = None,
+               device_time: int = None):
+        entry_num = self._find_entry_num(log, prefix)
+        if entry_num is not None and self.entries[entry_num].store and \
+                self.logs_file.write_log(tag + log, stamp, entry_num, device_time):
+            self.new_rows += 1
+
+    def render(self):
+        if not self.new_rows:
+            return
+        if self.new_rows < self.size.rows and not self.dirty and self.win is not None:
+            self._scroll()
+        else:
             self._redraw()
 
     def hold_cursor(self):
@@ -410,41 +1326,128 @@ class Logs(Window):
         self.logs_file.unhold_cursor()
         self._redraw()
 
-    def move_cursor(self, move: CursorMove):
-        self.logs_file.move_cursor(move)
+    def move_cursor(self, move: CursorMove, count: int = 1):
+        self.logs_file.move_cursor(move, count)
+        self._redraw()
+
+    def move_page(self, move: CursorMove):
+        self.move_cursor(move, max(1, self.size.rows))
+
+    def goto(self, position: str):
+        try:
+            if position.endswith('%'):
+                self.logs_file.goto_percentage(float(position[:-1]))
+            else:
+                self.logs_file.goto_line(int(position))
+        except ValueError:
+            return
         self._redraw()
 
     def set_filter(self, filter: str):
         self.logs_file.set_filter(filter)
         self._redraw()
 
+    def update_entries(self):
+        self.logs_file.set_hidden(self._hidden_entries())
+        self._redraw()
+
+    def count_entries(self):
+        return self.logs_file.count_entries(self.logs_file.first_line,
+                                            self.logs_file.lines_count,
+                                            len(self.entries))
+
+    def set_time_format(self, time_format: TimeFormat):
+        self.time_format = time_format
+        self._redraw()
+
     def search(self, text: str):
         self.logs_file.search(text)
         self._redraw()
 
     def _redraw(self):
+        self.invalidate()
+        self.draw()
+
+    def _create_win(self):
+        super()._create_win()
+        if self.win is not None:
+            self.win.idlok(True)
+
+    def _draw(self):
+        self.new_rows = 0
         rows = self.size.rows
-        if not self.visible or not rows:
-            return
 
         self.clear()
         logs = self.logs_file.read_logs(rows)
+        times = self._read_times(rows)
         row = rows - len(logs)
-        for line in range(len(logs)):
-            self._draw_log(logs[line], row + line)
-
-    def _draw_log(self, log: str, row: int):
-        for entry in self.entries:
-            if log.startswith(entry.prefix):
-                text = log if self.show_prefix else log[len(entry.prefix):]
-                self.addstr(text, row, 0, entry.colors)
-                return
+        for line, log in enumerate(logs):
+            self._draw_log(log, row + line, self._format_time(times, line - len(logs)))
 
-    def _should_show_log(self, log: str):
-        for entry in self.entries:
-            if log.startswith(entry.prefix):
-                return entry.show
-        return False
+    def _scroll(self):
+        new_rows = self.new_rows
+        self.new_rows = 0
+        rows = self.size.rows
+        if not self.visible or self.win is None:
+            return
+
+        self.win.scrollok(True)
+        self.win.scroll(new_rows)
+        self.win.scrollok(False)
+
+        logs = self.logs_file.read_logs(rows)
+        times = self._read_times(new_rows)
+        for line in range(new_rows):
+            self._draw_log(logs[line - new_rows],
+                           rows - new_rows + line,
+                           self._format_time(times, line - new_rows))
+        self.win.noutrefresh()
+
+    def _read_times(self, rows: int):
+        if self.time_format == TimeFormat.OFF:
+            return []
+        return self.logs_file.read_times(rows + 1, self.time_format == TimeFormat.DEVICE)
+
+    def _format_time(self, times: list, line: int):
+        if self.time_format == TimeFormat.OFF:
+            return ''
+        if self.time_format == TimeFormat.ABSOLUTE:
+            stamp = (times[line] + self.logs_file.clock_offset) / 1e9
+            return datetime.fromtimestamp(stamp).strftime('%H:%M:%S.%f ')
+        if self.time_format == TimeFormat.DEVICE:
+            if times[line] == DEVICE_TIME_UNKNOWN:
+                return ' ' * TIME_WIDTH
+            return f"{times[line] / 1e3:{TIME_WIDTH - 1}.3f} "
+        if line - 1 < -len(times):
+            return ' ' * TIME_WIDTH
+        return f"{(times[line] - times[line - 1]) / 1e9:+{TIME_WIDTH - 1}.6f} "
+
+    def _draw_log(self, log: str, row: int, time_text: str = ''):
+        tag = self._find_tag(log)
+        entry = self._find_entry(log[len(tag):])
+        if entry:
+            text = log if self.show_prefix else tag + log[len(tag) + len(entry.prefix):]
+            self.addstr(time_text, row)
+            self.addstr(text, row, len(time_text), entry.colors)
+
+    def _find_tag(self, log: str):
+        if not self.tagged or not log.startswith('['):
+            return ''
+        end = log.find('] ')
+        return log[:end + len('] ')] if end >= 0 else ''
+
+    def _hidden_entries(self):
+        return frozenset(filter(
+            lambda entry_num: self.entries[entry_num].store and not self.entries[entry_num].show,
+            range(len(self.entries))))
+
+    def _find_entry_num(self, log: str, prefix: str = None):
+        entry_nums = self.entries_trie.match(log, prefix)
+        return entry_nums[0] if entry_nums else None
+
+    def _find_entry(self, log: str):
+        entry_num = self._find_entry_num(log)
+        return self.entries[entry_num] if entry_num is not None else None
 
 
 class NavigationButton(Window):
@@ -454,59 +1457,99 @@ class NavigationButton(Window):
         self.text = text
         self.colors = colors
 
-    def refresh(self, pos: Pos, visible: bool):
-        super().refresh(pos, visible)
-        if self.visible:
-            self.addstr(self.key)
-            self.addstr(self.text, 0, len(self.key), self.colors)
+    def _draw(self):
+        self.addstr(self.key)
+        self.addstr(self.text, 0, len(self.key), self.colors)
 
 
 class Navigation(Window):
-    def __init__(self, stdscr, logs: Logs, colors: int):
+    def __init__(self, stdscr, views: list, colors: int, search_all=None):
         super().__init__(stdscr, Size(1, 0))
-        self.logs = logs
+        self.views = views
+        self.search_all = search_all
+        self.logs = views[0]
         self.colors = colors
         self.stoped = False
         self.searching = False
+        self.searching_all = False
         self.search = ''
         self.filtering = False
         self.filter = ''
+        self.jumping = False
+        self.position = ''
+        self.toggling = False
+        self.invalid = False
+        self.input_decoder = codecs.getincrementaldecoder('utf-8')(errors='ignore')
+        self.rate = ''
         self.stop_button = self._create_button('Enter', 'Stop'.ljust(7))
         self.resume_button = self._create_button('Esc', 'Resume'.ljust(7))
         self.edit_buttons = [
             self._create_button('Enter', 'Apply'.ljust(7)),
             self._create_button('Esc', 'Cancel'.ljust(7))]
+        self.close_button = self._create_button('Esc', 'Close'.ljust(7))
         self.main_buttons = [
             self._create_button('F3', 'Search'.ljust(7)),
             self._create_button('F4', 'Filter'.ljust(7)),
+            self._create_button('F5', 'Goto'.ljust(7)),
+            self._create_button('F6', 'Time'.ljust(7)),
+            self._create_button('F7', 'All'.ljust(7)),
+            self._create_button('F8', 'Levels'.ljust(7)),
             self._create_button('F10', 'Quit'.ljust(7))]
+        self.view_button = None
+        if len(views) > 1:
+            self._create_view_button()
+
+    def _create_view_button(self):
+        self.view_width = max(map(lambda view: len(view.name), self.views)) + 1
+        if self.view_button is None:
+            self.view_button = self._create_button('F2', '')
+            self.main_buttons.insert(0, self.view_button)
+        self.view_button.text = self.logs.name.ljust(self.view_width)
+        self.view_button.resize(Size(1, len(self.view_button.key) + self.view_width))
 
     def _create_button(self, key: str, text: str):
         rows = len(key) + len(text)
         return NavigationButton(self.stdscr, Size(1, rows), key, text, self.colors)
 
-    def refresh(self, pos: Pos, visible: bool):
-        super().refresh(pos, visible)
-        self._redraw()
-
     def pull(self, ch: int):
         if ch == curses.KEY_ENTER or ch == 13 or ch == ord('\n'):
             if self.filtering:
-                self.filtering = False
-                self.logs.set_filter(self.filter)
+                try:
+                    self.logs.set_filter(self.filter)
+                    self.filtering = False
+                except re.error:
+                    self.invalid = True
             elif self.searching:
-                self.searching = False
-                self.logs.search(self.search)
+                try:
+                    if self.searching_all:
+                        self.search_all(self.search)
+                    else:
+                        self.logs.search(self.search)
+                    self.searching = False
+                except re.error:
+                    self.invalid = True
+            elif self.jumping:
+                self.jumping = False
+                self.logs.goto(self.position)
+                self.stoped = True
+            elif self.toggling:
+                self.toggling = False
             else:
                 self.logs.hold_cursor()
                 self.stoped = True
             self._redraw()
         elif ch == 27:
+            self.invalid = False
             if self.filtering:
                 self.filtering = False
                 self.filter = ''
                 self.logs.set_filter(self.filter)
+            elif self.jumping:
+                self.jumping = False
+            elif self.toggling:
+                self.toggling = False
             else:
+                self.searching = False
                 self.logs.unhold_cursor()
                 self.stoped = False
             self._redraw()
@@ -518,48 +1561,142 @@ class Navigation(Window):
             self.logs.move_cursor(CursorMove.DOWN)
             self.stoped = True
             self._redraw()
+        elif ch == curses.KEY_PPAGE:
+            self.logs.move_page(CursorMove.UP)
+            self.stoped = True
+            self._redraw()
+        elif ch == curses.KEY_NPAGE:
+            self.logs.move_page(CursorMove.DOWN)
+            self.stoped = True
+            self._redraw()
+        elif ch == curses.KEY_F2 and len(self.views) > 1:
+            self._switch_view(self.views[(self.views.index(self.logs) + 1) % len(self.views)])
+            self._redraw()
         elif ch == curses.KEY_F3:
+            self.invalid = False
             self.searching = True
+            self.searching_all = False
             self.filtering = False
+            self.jumping = False
+            self.toggling = False
             self.logs.hold_cursor()
             self.stoped = True
             self._redraw()
         elif ch == curses.KEY_F4:
+            self.invalid = False
             self.filtering = True
             self.searching = False
+            self.jumping = False
+            self.toggling = False
+            self._redraw()
+        elif ch == curses.KEY_F5:
+            self.jumping = True
+            self.filtering = False
+            self.searching = False
+            self.toggling = False
+            self.position = ''
+            self._redraw()
+        elif ch == curses.KEY_F6:
+            time_formats = list(TimeFormat)
+            time_format = time_formats[(time_formats.index(self.logs.time_format) + 1) %
+                                       len(time_formats)]
+            for view in self.views:
+                view.set_time_format(time_format)
+        elif ch == curses.KEY_F7 and self.search_all:
+            self.invalid = False
+            self.searching = True
+            self.searching_all = True
+            self.filtering = False
+            self.jumping = False
+            self.toggling = False
+            self._redraw()
+        elif ch == curses.KEY_F8:
+            self.invalid = False
+            self.toggling = True
+            self.filtering = False
+            self.searching = False
+            self.jumping = False
             self._redraw()
         elif ch == curses.KEY_F10:
             exit_stdscr(self.stdscr)
 
         if self.filtering:
-            if ch == curses.KEY_BACKSPACE:
-                self.filter = self.filter[:-1]
-                self._redraw()
-            elif ch >= ord('!') and ch <= ord('~'):
-                self.filter += chr(ch)
+            filter = self._edit(self.filter, ch)
+            if filter != self.filter:
+                self.filter = filter
+                self.invalid = False
                 self._redraw()
         elif self.searching:
-            if ch == curses.KEY_BACKSPACE:
-                self.search = self.search[:-1]
+            search = self._edit(self.search, ch)
+            if search != self.search:
+                self.search = search
+                self.invalid = False
+                self._redraw()
+        elif self.jumping:
+            if ch == curses.KEY_BACKSPACE or ch == 127:
+                self.position = self.position[:-1]
                 self._redraw()
-            elif ch >= ord('!') and ch <= ord('~'):
-                self.search += chr(ch)
+            elif ch >= ord('0') and ch <= ord('9') or ch == ord('.') or ch == ord('%'):
+                self.position += chr(ch)
+                self._redraw()
+        elif self.toggling:
+            entry_num = ch - ord('1')
+            if entry_num >= 0 and entry_num < min(9, len(self.logs.entries)) and \
+                    self.logs.entries[entry_num].store:
+                entry = self.logs.entries[entry_num]
+                entry.show = not entry.show
+                for view in self.views:
+                    view.update_entries()
                 self._redraw()
         else:
             if ch == ord('q'):
                 exit_stdscr(self.stdscr)
 
+    def _edit(self, text: str, ch: int):
+        if ch == curses.KEY_BACKSPACE or ch == 127:
+            return text[:-1]
+        if ch >= ord(' ') and ch <= 0xff:
+            return text + self.input_decoder.decode(bytes([ch]))
+        return text
+
+    def set_rate(self, rate: str):
+        if rate != self.rate:
+            self.rate = rate
+            self._redraw()
+
+    def show_view(self, logs):
+        if len(self.views) > 1:
+            self._create_view_button()
+        self._switch_view(logs)
+        self._redraw()
+
+    def _switch_view(self, logs):
+        logs.resize(self.logs.size)
+        self.logs.refresh(self.logs.pos, False)
+        logs.refresh(self.logs.pos, True)
+        self.logs = logs
+        self.view_button.text = logs.name.ljust(self.view_width)
+        self.stoped = logs.logs_file.held
+        self.filter = logs.logs_file.filter
+
     def _redraw(self):
+        self.invalidate()
+        self.draw()
+
+    def _draw(self):
         col = self._draw_panel()
         free_cols = max(0, self.size.cols - col)
         if free_cols:
             self.addstr(' ' * free_cols, 0, col, self.colors)
-        self.stdscr.refresh()
+        if free_cols > len(self.rate) + 1:
+            self.addstr(self.rate, 0, self.size.cols - len(self.rate) - 1, self.colors)
 
     def _draw_panel(self):
         buttons = list()
-        if self.filtering or self.searching:
+        if self.filtering or self.searching or self.jumping:
             buttons += self.edit_buttons
+        elif self.toggling:
+            buttons.append(self.close_button)
         else:
             buttons.append(
                 self.resume_button if self.stoped else self.stop_button)
@@ -576,10 +1713,12 @@ class Navigation(Window):
         for button in buttons:
             if col + button.size.cols > max_cols:
                 return col
+            button.invalidate()
             button.refresh(Pos(self.pos.row, col), self.visible)
             col += button.size.cols
 
-        if not self.filtering and not self.searching:
+        if not self.filtering and not self.searching and not self.jumping and \
+                not self.toggling:
             return col
 
         if col + 2 > max_cols:
@@ -587,7 +1726,18 @@ class Navigation(Window):
         self.addstr(' ' * 2, 0, col)
         col += 2
 
-        edit_prefix = 'Filter: ' if self.filtering else 'Search: '
+        if self.invalid:
+            edit_prefix, edit_text = 'Invalid: ', self.filter if self.filtering else self.search
+        elif self.filtering:
+            edit_prefix, edit_text = 'Filter: ', self.filter
+        elif self.searching and self.searching_all:
+            edit_prefix, edit_text = 'Search all: ', self.search
+        elif self.searching:
+            edit_prefix, edit_text = 'Search: ', self.search
+        elif self.toggling:
+            edit_prefix, edit_text = 'Levels: ', self._format_entries()
+        else:
+            edit_prefix, edit_text = 'Goto: ', self.position
         if col + len(edit_prefix) > max_cols:
             return col
         self.addstr(edit_prefix, 0, col, self.colors)
@@ -596,18 +1746,51 @@ class Navigation(Window):
         free_cols = max_cols - col
         if free_cols <= 0:
             return col
-        edit_text = self.filter if self.filtering else self.search
-        visible_text = edit_text[-free_cols:].ljust(free_cols)
+        visible_text = (edit_text[:free_cols] if self.toggling else
+                        edit_text[-free_cols:]).ljust(free_cols)
         self.addstr(visible_text, 0, col, self.colors)
         col += len(visible_text)
 
         return col
 
+    def _format_entries(self):
+        counts = self.logs.count_entries()
+        items = list()
+        for entry_num in range(len(self.logs.entries)):
+            entry = self.logs.entries[entry_num]
+            if entry.store:
+                key = str(entry_num + 1) if entry_num < 9 else ' '
+                name = entry.prefix.strip(': ') or '*'
+                items.append(f"{key}{'+' if entry.show else '-'}{name} {counts[entry_num]}")
+        return '  '.join(items)
+
 
 class LogsMonitor():
-    def __init__(self, stdscr, config, logs_dir: str):
+    def __init__(self, stdscr, config, logs_dir: str, reader):
         self.stdscr = stdscr
+        self.config = config
+        self.logs_dir = logs_dir
+        self.reader = reader
         self.observers = list()
+        self.statuses = PrefixTrie()
+        self.field_statuses = dict()
+        self.throttled = list()
+        self.metrics_views = list()
+        self.frame_time = 1 / config.get('fps', 30)
+        self.last_render = 0
+        self.pending = False
+        self.renders = 0
+        self.render_time = 0
+        self.render_time_max = 0
+        self.metrics = Metrics()
+        self.metrics_interval = config.get('metrics_interval', 1)
+        self.metrics_time = time.monotonic()
+        self.metrics_counts = None
+        metrics_file = config.get('metrics_file', None)
+        self.metrics_file = open(metrics_file, 'a') if metrics_file else None
+        self.metrics_pending = self.metrics_file is not None
+        self.archive_search = None
+        self.search_logs = None
 
         self.last_color = 0
         curses.init_pair(DEFAULT_COLORS, -1, -1)
@@ -619,19 +1802,64 @@ class LogsMonitor():
         self.head = self._create_window(head_config) if head_config else None
         self.head_cleaner = Space(
             self.stdscr, self.head.size, DEFAULT_COLORS) if self.head else None
-
-        entries = self._create_entries(config.get(
+        self.statuses.compile()
+        self.fields = PrefixTrie()
+        if self.field_statuses:
+            for field_config in config.get('fields', [{}]):
+                field_pattern = FieldPattern(field_config.get('prefix', ''),
+                                             field_config.get('pattern', FIELD_KEY_VALUE))
+                self.fields.add(field_pattern.prefix, field_pattern)
+        self.fields.compile()
+
+        self.entries = self._create_entries(config.get(
             'logs', [{'prefix': '', 'show': True}]))
-        self.logs = Logs(
-            stdscr, LogsFile(logs_dir), entries, config.get('show_prefix', True))
-        self.observers.append(self.logs)
+        self.show_prefix = config.get('show_prefix', True)
+        self.time_format = parse_time_format(config.get('timestamps', 'off'))
+        ports_config = config.get('ports', None)
+        if ports_config:
+            names = list(map(lambda num: self._get_port_name(ports_config[num], num),
+                             range(len(ports_config))))
+            self.ports_logs = list(map(lambda name: Logs(
+                stdscr,
+                self._create_logs_file(config, os.path.join(logs_dir, name)),
+                self.entries, self.show_prefix, name, time_format=self.time_format), names))
+            self.tags = list(map(lambda name: f"[{name}] ", names))
+        else:
+            self.ports_logs = [Logs(
+                stdscr, self._create_logs_file(config, logs_dir), self.entries, self.show_prefix,
+                self._get_port_name(config, 0), time_format=self.time_format)]
+            self.tags = ['']
+        self.merged_logs = Logs(
+            stdscr,
+            self._create_logs_file(config, os.path.join(logs_dir, MERGED_DIR)),
+            self.entries, self.show_prefix, MERGED_DIR, True, self.time_format) \
+            if ports_config and config.get('merged_view', False) else None
+        self.views = ([self.merged_logs] if self.merged_logs else []) + self.ports_logs
+        self.observers += self.views
 
         nav_colors = self._create_colors(config.get(
             'navigation_colors', {'foreground': 'black', 'background': 'cyan'}))
-        self.nav = Navigation(stdscr, self.logs, nav_colors)
+        self.nav = Navigation(stdscr, self.views, nav_colors, self.search_all)
 
+        self.metrics_counts = self._metrics_counts()
         self.refresh()
 
+    def _create_logs_file(self, config, logs_dir: str):
+        return LogsFile(logs_dir,
+                        config.get('save_index', False),
+                        int(config.get('segment_size', 0) * 1024 * 1024),
+                        config.get('segment_duration', 0) * 60,
+                        config.get('max_segments', 0),
+                        config.get('compress_segments', False),
+                        FlushPolicy(int(config.get('flush_size', 64) * 1024),
+                                    config.get('flush_interval', 1),
+                                    Fsync(config.get('fsync', 'never'))),
+                        int(config.get('memory_size', 0) * 1024 * 1024),
+                        config.get('spill_on_stop', False))
+
+    def _get_port_name(self, config, num: int):
+        return config.get('name', os.path.basename(config.get('port', f"port{num}")))
+
     def _create_window(self, config):
         if 'space' in config:
             return self._create_space(config['space'])
@@ -645,6 +1873,8 @@ class LogsMonitor():
             return self._create_label(config['label'])
         elif 'status' in config:
             return self._create_status(config['status'])
+        elif 'metrics' in config:
+            return self._create_metrics(config['metrics'])
         else:
             raise ValueError(f"Invalid config\n {config}")
 
@@ -684,10 +1914,26 @@ class LogsMonitor():
                         self._create_colors(config.get('colors', {})),
                         config.get('initial', ""),
                         config.get('wrap_around', False),
-                        config.get('insert_spaces', False))
+                        config.get('insert_spaces', False),
+                        config.get('field', None),
+                        config.get('interval', 0))
         self.observers.append(status)
+        if status.field is not None:
+            self.field_statuses.setdefault(status.field, list()).append(status)
+        else:
+            self.statuses.add(status.prefix, status)
+        if status.interval:
+            self.throttled.append(status)
         return status
 
+    def _create_metrics(self, config):
+        metrics_view = MetricsView(self.stdscr,
+                                   self._create_size(config['size']),
+                                   self._create_colors(config.get('colors', {})),
+                                   config.get('inline', False))
+        self.metrics_views.append(metrics_view)
+        return metrics_view
+
     def _create_size(self, config):
         return Size(config.get('rows', 0), config.get('cols', 0))
 
@@ -708,12 +1954,16 @@ class LogsMonitor():
         return self.last_color
 
     def _create_entries(self, config):
+        if len(config) > MAX_ENTRIES:
+            raise ValueError(f"Too many log entries, max {MAX_ENTRIES}")
         return list(map(lambda cfg: self._create_entry(cfg), config))
 
     def _create_entry(self, config):
+        show = config.get('show', True)
         return LogEntry(config.get('prefix', ''),
-                        config.get('show', True),
-                        self._create_colors(config.get('colors', {})))
+                        show,
+                        self._create_colors(config.get('colors', {})),
+                        config.get('store', show))
 
     def refresh(self):
         rows, cols = self.stdscr.getmaxyx()
@@ -729,30 +1979,814 @@ class LogsMonitor():
                 free_size -= self.head.size.rows
                 cleaner_size = Size(self.head_cleaner.size.rows, cols)
                 self.head_cleaner.resize(cleaner_size)
-                self.head_cleaner.refresh(Pos(0, 0), True)
+                if self.head_cleaner.refresh(Pos(0, 0), True):
+                    self.head.invalidate()
                 self.head.refresh(Pos(0, 0), True)
             else:
+                self.head_cleaner.refresh(Pos(0, 0), False)
                 self.head.refresh(Pos(0, 0), False)
         else:
             enable_head = False
 
         logs_pos = self.head.size.rows if enable_head else 0
-        self.logs.resize(Size(free_size, cols))
-        self.logs.refresh(Pos(logs_pos, 0), free_size)
-
-        self.stdscr.refresh()
-
-    def on_log(self, log: str):
+        for view in self.views:
+            view.resize(Size(free_size, cols))
+            view.refresh(Pos(logs_pos, 0), free_size and view is self.nav.logs)
+
+        curses.doupdate()
+
+    def on_log(self,
+               log: str,
+               source: int = 0,
+               stamp: int = None,
+               prefix: str = None,
+               device_time: int = None):
+        if not self.metrics_pending:
+            self.metrics_pending = True
+            self.metrics_time = time.monotonic()
+            self.metrics_counts = self._metrics_counts()
+        for status in self.statuses.match(log, prefix):
+            status.on_log(log)
+        for field_pattern in self.fields.match(log, prefix):
+            for name, value in field_pattern.parse(log):
+                for status in self.field_statuses.get(name, ()):
+                    if log.startswith(status.prefix):
+                        status.on_field(value)
+        self.ports_logs[source].on_log(log, stamp=stamp, prefix=prefix, device_time=device_time)
+        if self.merged_logs:
+            self.merged_logs.on_log(log, self.tags[source], stamp, prefix, device_time)
+        self.pending = True
+
+    def render(self):
+        now = time.monotonic()
+        if not self.pending or now - self.last_render < self.frame_time:
+            return
+        self.last_render = now
+        self.pending = False
         for observer in self.observers:
-            observer.on_log(log)
-        self.stdscr.refresh()
+            observer.render()
+        curses.doupdate()
+        self.pending = any(map(lambda status: status.waiting, self.throttled))
+        render_time = time.monotonic() - now
+        self.renders += 1
+        self.render_time += render_time
+        self.render_time_max = max(self.render_time_max, render_time)
+
+    def search_all(self, expression: str):
+        archive_search = ArchiveSearch(self.logs_dir, expression)
+        if self.archive_search:
+            self.archive_search.cancel()
+        for view in self.views:
+            view.logs_file.flush()
+        search_logs = Logs(
+            self.stdscr,
+            self._create_logs_file(self.config, os.path.join(self.logs_dir, SEARCH_DIR)),
+            self.entries, self.show_prefix, SEARCH_DIR, True, self.nav.logs.time_format)
+        if self.search_logs is None:
+            self.views.append(search_logs)
+            self.observers.append(search_logs)
+        else:
+            self.search_logs.logs_file.remove()
+            self.views[self.views.index(self.search_logs)] = search_logs
+            self.observers[self.observers.index(self.search_logs)] = search_logs
+        self.search_logs = search_logs
+        self.archive_search = archive_search
+        self.archive_search.start()
+        self.refresh()
+        self.nav.show_view(self.search_logs)
+
+    def tick(self):
+        if self.archive_search:
+            for tag, log in self.archive_search.pop_matches():
+                self.search_logs.on_log(log, tag)
+                self.pending = True
+            if self.archive_search.done and not self.archive_search.matches:
+                self.archive_search = None
+        for view in self.views:
+            view.logs_file.flush_if_due()
+        now = time.monotonic()
+        if self.metrics_pending and now - self.metrics_time >= self.metrics_interval:
+            self._update_metrics(now)
+
+    def wait_time(self):
+        delays = list(map(lambda view: view.logs_file.flush_delay(), self.views))
+        if self.pending:
+            delays.append(self.last_render + self.frame_time - time.monotonic())
+        if self.metrics_pending:
+            delays.append(self.metrics_time + self.metrics_interval - time.monotonic())
+        if self.archive_search:
+            delays.append(self.frame_time)
+        delays = list(filter(lambda delay: delay is not None, delays))
+        return max(0, min(delays)) if delays else None
+
+    def close(self):
+        for view in self.views:
+            if view is self.search_logs:
+                view.logs_file.remove()
+            else:
+                view.logs_file.close()
+        if self.metrics_file:
+            self.metrics_file.close()
 
     def pull(self):
-        ch = self.stdscr.getch()
-        if ch == curses.KEY_RESIZE:
-            self.refresh()
+        while True:
+            ch = self.stdscr.getch()
+            if ch == -1:
+                return
+            if ch == curses.KEY_RESIZE:
+                self.refresh()
+            else:
+                self.nav.pull(ch)
+                curses.doupdate()
+
+    def _metrics_counts(self):
+        return (self.reader.received_lines,
+                self.reader.received_size,
+                sum(map(lambda view: view.logs_file.lines_count, self.views)),
+                sum(map(lambda view: view.logs_file.write_time, self.views)),
+                self.renders,
+                self.render_time)
+
+    def _update_metrics(self, now: float):
+        counts = self._metrics_counts()
+        lines, size, writes, write_time, renders, render_time = map(
+            lambda pair: pair[0] - pair[1], zip(counts, self.metrics_counts))
+        elapsed = now - self.metrics_time
+        write_time_max = max(map(lambda view: view.logs_file.write_time_max, self.views))
+        self.metrics = Metrics(lines / elapsed,
+                               size / elapsed,
+                               self.reader.decode_errors,
+                               self.reader.queue_peak,
+                               self.reader.dropped,
+                               render_time / renders * 1000 if renders else 0,
+                               self.render_time_max * 1000,
+                               write_time / writes / 1000 if writes else 0,
+                               write_time_max / 1000)
+        self.reader.queue_peak = 0
+        self.render_time_max = 0
+        for view in self.views:
+            view.logs_file.write_time_max = 0
+        self.metrics_pending = counts != self.metrics_counts or self.metrics_file is not None
+        self.metrics_time = now
+        self.metrics_counts = counts
+
+        if self.metrics_file:
+            self.metrics_file.write(
+                json.dumps({'time': time.time(), **asdict(self.metrics)}) + '\n')
+            self.metrics_file.flush()
+        self.nav.set_rate(
+            f"{self.metrics.lines_rate:.0f} lines/s {self.metrics.bytes_rate / 1024:.1f} KB/s")
+        for metrics_view in self.metrics_views:
+            metrics_view.set_metrics(self.metrics)
+            metrics_view.draw()
+        curses.doupdate()
+
+    def resize(self):
+        cols, rows = os.get_terminal_size(sys.__stdout__.fileno())
+        curses.resizeterm(rows, cols)
+        self.refresh()
+
+
+class ElfStrings():
+    def __init__(self, path: str):
+        with open(path, 'rb') as file:
+            self.data = file.read()
+        if self.data[:4] != b'\x7fELF' or self.data[4] not in [1, 2] or self.data[5] not in [1, 2]:
+            raise ValueError(f"Invalid ELF file: {path}")
+        is_64 = self.data[4] == 2
+        order = '<' if self.data[5] == 1 else '>'
+        header_format = order + ('16xHHIQQQIHHHHHH' if is_64 else '16xHHIIIIIHHHHHH')
+        section_format = order + ('IIQQQQIIQQ' if is_64 else 'IIIIIIIIII')
+        header = struct.unpack_from(header_format, self.data)
+        sections_offset, section_size, sections_count = header[5], header[10], header[11]
+        # AVR keeps literals in .data, copied to RAM at startup, ELF places RAM at 0x800000
+        is_avr = header[1] == ELF_EM_AVR
+        self.address_offset = ELF_AVR_DATA_ADDRESS if is_avr else 0
+
+        self.sections = list()
+        for num in range(sections_count):
+            _, kind, flags, address, offset, size, *_ = struct.unpack_from(
+                section_format, self.data, sections_offset + num * section_size)
+            if kind == ELF_SHT_PROGBITS and flags & ELF_SHF_ALLOC and address \
+                    and (is_avr or not flags & ELF_SHF_WRITE):
+                self.sections.append((address, offset, size))
+        self.sections.sort()
+        self.addresses = list(map(lambda section: section[0], self.sections))
+        self.strings = dict()
+
+    def get(self, address: int):
+        text = self.strings.get(address)
+        if text is None:
+            text = self._read_string(address)
+            self.strings[address] = text
+        return text
+
+    def _read_string(self, address: int):
+        address += self.address_offset
+        num = bisect_right(self.addresses, address) - 1
+        if num < 0:
+            return None
+        section_address, offset, size = self.sections[num]
+        if address >= section_address + size:
+            return None
+        begin = offset + address - section_address
+        end = self.data.find(b'\0', begin, offset + size)
+        return self.data[begin:end if end >= 0 else offset + size].decode(errors='replace')
+
+
+class LogsDecoder():
+    def __init__(self,
+                 separator: str = ': ',
+                 strings: ElfStrings = None,
+                 max_length: int = FRAME_MAX_LENGTH):
+        self.strings = strings
+        self.max_length = max_length
+        self.prefixes = list(map(lambda name: f"{name}{separator}", LEVEL_NAMES))
+        self.frame_prefixes = dict(map(
+            lambda flags: (bytes([flags]), None if flags & FRAME_WITHOUT_PREFIX else
+                           self.prefixes[flags & FRAME_LEVEL_MASK]),
+            compress(range(256), FRAME_FLAGS)))
+        self.tokens = dict()
+        self.rest = b''
+        self.pending_frame = False
+        self.decode_errors = 0
+
+    @property
+    def partial_line(self):
+        return bool(self.rest) and not self.pending_frame
+
+    def feed(self, data: bytes):
+        data = self.rest + data if self.rest else data
+        logs = list()
+        begin = self._split_frames(data, logs) if FRAME_MAGIC in data else 0
+        return self._scan_frames(data, begin, logs)
+
+    def flush(self):
+        logs = list()
+        if self.rest:
+            self._decode_lines([self.rest], logs)
+            self.rest = b''
+            self.pending_frame = False
+        return logs
+
+    def _split_frames(self, data: bytes, logs: list):
+        pieces = iter(FRAME_HEADER.split(data))
+        tail = next(pieces)
+        prefixes = self.frame_prefixes
+        for flags, device_time, length_data, rest in zip(pieces, pieces, pieces, pieces):
+            length = length_data[0] if len(length_data) == 1 else \
+                self._read_varint(length_data, 0, len(length_data))[0]
+            if len(rest) < length or length > self.max_length:
+                pieces = list(pieces)
+                unparsed = len(tail) + len(FRAME_MAGIC) + len(flags) + len(device_time) + \
+                    len(length_data) + len(rest) + sum(map(len, pieces)) + \
+                    len(pieces) // 4 * len(FRAME_MAGIC)
+                return len(data) - unparsed
+            if tail:
+                self._decode_lines(tail.split(b'\n'), logs)
+            if len(rest) == length:
+                payload = rest
+                tail = b''
+            else:
+                payload = rest[:length]
+                tail = rest[length:]
+            device_time = self._read_varint(device_time, 0, len(device_time))[0]
+            prefix = prefixes[flags]
+            if prefix is None or flags[0] & FRAME_TOKENIZED or b'\n' in payload:
+                self._decode_frame(flags[0], device_time, payload, logs)
+                continue
+            try:
+                log = payload.decode()
+            except UnicodeDecodeError:
+                self.decode_errors += 1
+                log = payload.decode(errors='replace')
+            logs.append((prefix + log.rstrip('\r\0'), prefix, device_time))
+        return len(data) - len(tail)
+
+    def _scan_frames(self, data: bytes, begin: int, logs: list):
+        size = len(data)
+        pos = begin
+        while True:
+            magic = data.find(FRAME_MAGIC, pos)
+            if magic < 0:
+                break
+            header = magic + len(FRAME_MAGIC)
+            if header == size:
+                return self._keep_frame(data, begin, magic, logs)
+            pos = header
+            flags = data[header]
+            if not FRAME_FLAGS[flags]:
+                continue
+            device_time, end = self._read_varint(data, header + 1, size)
+            if device_time is None:
+                if end == size:
+                    return self._keep_frame(data, begin, magic, logs)
+                continue
+            if end < size and data[end] < 0x80:
+                length = data[end]
+                end += 1
+            else:
+                length, end = self._read_varint(data, end, size)
+                if length is None:
+                    if end == size:
+                        return self._keep_frame(data, begin, magic, logs)
+                    continue
+            if length > self.max_length:
+                continue
+            if end + length > size:
+                return self._keep_frame(data, begin, magic, logs)
+
+            if magic > begin:
+                self._decode_lines(data[begin:magic].split(b'\n'), logs)
+            self._decode_frame(flags, device_time, data[end:end + length], logs)
+            begin = pos = end + length
+        lines = data[begin:].split(b'\n')
+        self.rest = lines.pop()
+        self.pending_frame = False
+        self._decode_lines(lines, logs)
+        return logs
+
+    def _keep_frame(self, data: bytes, begin: int, magic: int, logs: list):
+        lines = data[begin:magic].split(b'\n')
+        self.rest = lines.pop() + data[magic:]
+        self.pending_frame = True
+        self._decode_lines(lines, logs)
+        return logs
+
+    def _decode_frame(self, flags: int, device_time: int, payload: bytes, logs: list):
+        if flags & FRAME_TOKENIZED:
+            log = self._expand_tokens(payload)
+        else:
+            try:
+                log = payload.decode()
+            except UnicodeDecodeError:
+                self.decode_errors += 1
+                log = payload.decode(errors='replace')
+        prefix = None if flags & FRAME_WITHOUT_PREFIX else self.prefixes[flags & FRAME_LEVEL_MASK]
+        if '\n' not in log:
+            if prefix is not None:
+                logs.append((prefix + log.rstrip('\r\0'), prefix, device_time))
+            else:
+                log = log.strip('\r\0')
+                if log:
+                    logs.append((log, None, device_time))
+            return
+        lines = log.split('\n')
+        if prefix is not None:
+            lines[0] = prefix + lines[0]
+        for line in lines:
+            line = line.strip('\r\0')
+            if line:
+                logs.append((line, prefix, device_time))
+                prefix = None
+
+    def _expand_tokens(self, payload: bytes):
+        texts = list()
+        size = len(payload)
+        pos = 0
+        try:
+            while pos < size:
+                kind = payload[pos]
+                pos += 1
+                if kind == TOKEN_STRING:
+                    token = FRAME_VARINT.match(payload, pos)
+                    if token is None:
+                        self.decode_errors += 1
+                        break
+                    pos = token.end()
+                    token = token.group()
+                    text = self.tokens.get(token)
+                    texts.append(text if text is not None else self._resolve_token(token))
+                elif kind == TOKEN_SIGNED or kind == TOKEN_UNSIGNED:
+                    value = payload[pos]
+                    if value < 0x80:
+                        pos += 1
+                    else:
+                        value, pos = self._read_varint(payload, pos, size)
+                        if value is None:
+                            self.decode_errors += 1
+                            break
+                    if kind == TOKEN_UNSIGNED:
+                        texts.append(str(value))
+                    else:
+                        texts.append(str(value >> 1 ^ -(value & 1)))
+                elif kind == TOKEN_FLOAT or kind == TOKEN_DOUBLE:
+                    value, = struct.unpack_from('<f' if kind == TOKEN_FLOAT else '<d', payload, pos)
+                    pos += 4 if kind == TOKEN_FLOAT else 8
+                    texts.append(f"{value:g}")
+                elif kind == TOKEN_BOOL:
+                    texts.append('1' if payload[pos] else '0')
+                    pos += 1
+                elif kind == TOKEN_CHAR:
+                    texts.append(payload[pos:pos + 1].decode(errors='replace'))
+                    pos += 1
+                elif kind == TOKEN_TEXT:
+                    end = payload.find(b'\0', pos)
+                    end = size if end < 0 else end
+                    texts.append(payload[pos:end].decode(errors='replace'))
+                    pos = end + 1
+                else:
+                    self.decode_errors += 1
+                    break
+        except (IndexError, struct.error):
+            self.decode_errors += 1
+        return ''.join(texts)
+
+    def _resolve_token(self, token: bytes):
+        address, _ = self._read_varint(token, 0, len(token))
+        text = self.strings.get(address) if self.strings else None
+        if text is None:
+            text = f"<{address:#x}>"
+        if len(self.tokens) >= TOKENS_CACHE_SIZE:
+            self.tokens.clear()
+        self.tokens[token] = text
+        return text
+
+    def _read_varint(self, data: bytes, pos: int, size: int):
+        value = 0
+        shift = 0
+        end = min(size, pos + FRAME_VARINT_SIZE)
+        while pos < end:
+            byte = data[pos]
+            pos += 1
+            value |= (byte & 0x7f) << shift
+            if byte < 0x80:
+                return value, pos
+            shift += 7
+        return None, pos
+
+    def _decode_lines(self, lines: list, logs: list):
+        for line in lines:
+            try:
+                log = line.decode()
+            except UnicodeDecodeError:
+                self.decode_errors += 1
+                log = line.decode(errors='replace')
+            log = log.strip('\r\n\0')
+            if len(log):
+                logs.append((log, None, None))
+
+    def _decode_line(self, line: bytes):
+        try:
+            return line.decode()
+        except UnicodeDecodeError:
+            self.decode_errors += 1
+            return line.decode(errors='replace')
+
+
+class ReplayPort():
+    def __init__(self, path: str):
+        self.port = path
+        self.file = open(path, 'rb')
+        self.in_waiting = REPLAY_CHUNK_SIZE
+        self.ready, self.ready_writer = os.pipe()
+        os.write(self.ready_writer, b'\0')
+
+    def fileno(self):
+        return self.ready
+
+    def read(self, size: int):
+        data = self.file.read(size)
+        if not data:
+            os.read(self.ready, 1)
+            self.in_waiting = 0
+        return data
+
+
+class ArchiveSearch(threading.Thread):
+    def __init__(self, logs_dir: str, expression: str):
+        super().__init__(daemon=True)
+        self.logs_dir = logs_dir
+        self.expression = expression
+        self.matches = deque()
+        self.done = False
+        self.cancelled = False
+        LogsFilter(expression)
+
+    def run(self):
+        try:
+            for path, line_num, offset, text in search_archives(self.logs_dir, self.expression):
+                if self.cancelled:
+                    break
+                tag = f"[{os.path.relpath(path, self.logs_dir)}:{line_num}] "
+                self.matches.append((tag, text))
+        finally:
+            self.done = True
+
+    def cancel(self):
+        self.cancelled = True
+
+    def pop_matches(self):
+        matches = list()
+        while self.matches:
+            matches.append(self.matches.popleft())
+        return matches
+
+
+class SerialReader(threading.Thread):
+    def __init__(self,
+                 ports: list,
+                 queue_size: int,
+                 decoders: list,
+                 lossless: bool = False,
+                 partial_line_timeout: float = 0):
+        super().__init__(daemon=True)
+        self.ports = ports
+        self.decoders = decoders
+        self.captures = [None] * len(ports)
+        self.captures_pending = False
+        self.lossless = lossless
+        self.partial_line_timeout = int(partial_line_timeout * 1e9)
+        self.read_stamps = [0] * len(ports)
+        self.interrupt, self.interrupt_writer = os.pipe()
+        # selectors accept only sockets on windows, ports are polled there
+        self.selector = None
+        if os.name != 'nt':
+            self.selector = selectors.DefaultSelector()
+            for source, ser in enumerate(ports):
+                self.selector.register(ser.fileno(), selectors.EVENT_READ, source)
+            self.selector.register(self.interrupt, selectors.EVENT_READ, None)
+        self.queue_size = queue_size
+        self.wakeup, self.wakeup_writer = os.pipe()
+        os.set_blocking(self.wakeup, False)
+        self.signalled = False
+        self.stopped = False
+        self.logs = deque()
+        self.condition = threading.Condition()
+        self.dropped = 0
+        self.received_lines = 0
+        self.received_size = 0
+        self.queue_peak = 0
+        self.error = None
+
+    def run(self):
+        source = None
+        timeout = None
+        try:
+            while not self.stopped:
+                ready = set()
+                sources = self._wait_ports(timeout)
+                for source in sources:
+                    ready.add(source)
+                    ser = self.ports[source]
+                    data = ser.read(max(1, ser.in_waiting))
+                    stamp = time.monotonic_ns()
+                    if not data:
+                        self._push_logs(source, stamp, self.decoders[source].flush())
+                        source = None
+                        continue
+                    self.read_stamps[source] = stamp
+                    self.received_size += len(data)
+                    if self.captures[source]:
+                        self.captures[source].write(data)
+                        self.captures_pending = True
+                    self._push_logs(source, stamp, self.decoders[source].feed(data))
+                    source = None
+                if not sources and self.captures_pending:
+                    self._flush_captures()
+                timeout = self._flush_partial_lines(ready)
+                if self.captures_pending:
+                    timeout = min(timeout, CAPTURE_FLUSH_TIMEOUT) if timeout is not None \
+                        else CAPTURE_FLUSH_TIMEOUT
+        except (serial.serialutil.SerialException, OSError) as e:
+            with self.condition:
+                self.error = serial.serialutil.SerialException(
+                    f"{self.ports[source].port}: {e}"
+                    if source is not None and len(self.ports) > 1 else e)
+                self._signal()
+                self.condition.notify()
+        finally:
+            self._close_captures()
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+        os.write(self.interrupt_writer, b'\0')
+        if self.is_alive():
+            self.join(READER_STOP_TIMEOUT)
+        else:
+            self._close_captures()
+
+    @property
+    def decode_errors(self):
+        return sum(map(lambda decoder: decoder.decode_errors, self.decoders))
+
+    def fileno(self):
+        return self.wakeup
+
+    def read_logs(self, timeout: float):
+        with self.condition:
+            if not self.logs and self.error is None:
+                self.condition.wait(timeout)
+            if self.signalled:
+                os.read(self.wakeup, 1)
+                self.signalled = False
+            self.queue_peak = max(self.queue_peak, len(self.logs))
+            if not self.logs and self.error is not None:
+                raise self.error
+            logs = list(self.logs)
+            self.logs.clear()
+            self.condition.notify()
+        return logs
+
+    def _wait_ports(self, timeout: float):
+        if self.selector is not None:
+            return list(filter(lambda source: source is not None,
+                               map(lambda event: event[0].data, self.selector.select(timeout))))
+        end = None if timeout is None else time.monotonic() + timeout
+        while not self.stopped:
+            sources = list(filter(lambda source: self.ports[source].in_waiting,
+                                  range(len(self.ports))))
+            if sources or end is not None and time.monotonic() >= end:
+                return sources
+            time.sleep(POLL_INTERVAL)
+        return []
+
+    def _flush_partial_lines(self, ready: set):
+        if not self.partial_line_timeout:
+            return None
+        timeout = None
+        now = time.monotonic_ns()
+        for source, decoder in enumerate(self.decoders):
+            if not decoder.partial_line:
+                continue
+            remaining = max(0, self.read_stamps[source] + self.partial_line_timeout - now)
+            if not remaining and source not in ready:
+                self._push_logs(source, self.read_stamps[source], decoder.flush())
+            elif timeout is None or remaining < timeout:
+                timeout = remaining
+        return None if timeout is None else timeout / 1e9
+
+    def _flush_captures(self):
+        for capture in filter(None, self.captures):
+            capture.flush()
+        self.captures_pending = False
+
+    def _close_captures(self):
+        for capture in filter(None, self.captures):
+            capture.close()
+        self.captures = [None] * len(self.ports)
+        self.captures_pending = False
+
+    def _signal(self):
+        if not self.signalled:
+            os.write(self.wakeup_writer, b'\0')
+            self.signalled = True
+
+    def _push_logs(self, source: int, stamp: int, logs: list):
+        with self.condition:
+            self.received_lines += len(logs)
+            while self.lossless and len(self.logs) >= self.queue_size and not self.stopped:
+                self.condition.wait()
+            free = self.queue_size - len(self.logs)
+            if len(logs) > free and not self.lossless:
+                self.dropped += len(logs) - free
+                logs = logs[:free]
+            self.logs.extend(map(lambda log: (source, log[0], stamp, log[1], log[2]), logs))
+            if logs:
+                self._signal()
+            self.condition.notify()
+
+
+@lru_cache(maxsize=None)
+def char_width(ch: str):
+    if unicodedata.category(ch) in ('Mn', 'Me', 'Cf'):
+        return 0
+    return 2 if unicodedata.east_asian_width(ch) in ('W', 'F') else 1
+
+
+class CharWidths():
+    def __init__(self):
+        self.chars = dict.fromkeys(range(128), '\x01')
+        self.blocks = bytearray(b'\xff' * WIDTHS_BLOCK_SIZE)
+        self.exceptions = set()
+        self.exceptions_regex = None
+
+    def widths(self, text: str):
+        data = text.encode('utf-16-le', 'surrogatepass')
+        if len(data) == 2 * len(text):
+            blocks = data[1::2]
+            widths = blocks.translate(self.blocks)
+            if b'\xff' in widths:
+                self._add_blocks(filter(lambda block: self.blocks[block] == 0xff, set(blocks)))
+                widths = blocks.translate(self.blocks)
+            if self.exceptions_regex is None or not self.exceptions_regex.search(text):
+                return widths.decode()
+        return self._char_widths(text)
+
+    def _add_blocks(self, blocks):
+        for block in blocks:
+            begin = block * WIDTHS_BLOCK_SIZE
+            chars = list(map(chr, range(begin, begin + WIDTHS_BLOCK_SIZE)))
+            widths = list(map(char_width, chars))
+            width = max(set(widths), key=widths.count)
+            self.blocks[block] = width
+            self.exceptions.update(compress(chars, map(lambda other: other != width, widths)))
+        if self.exceptions:
+            self.exceptions_regex = re.compile(f"[{re.escape(''.join(sorted(self.exceptions)))}]")
+
+    def _char_widths(self, text: str):
+        widths = text.translate(self.chars)
+        if not widths.isascii():
+            self.chars.update(map(lambda ch: (ord(ch), chr(char_width(ch))),
+                                  filter(lambda ch: not ch.isascii(), set(widths))))
+            widths = text.translate(self.chars)
+        return widths
+
+
+CHAR_WIDTHS = CharWidths()
+
+
+def text_widths(text: str):
+    return CHAR_WIDTHS.widths(text)
+
+
+def clip_text(text: str, cols: int):
+    if text.isascii():
+        return text[:cols]
+    widths = list(accumulate(text_widths(text).encode()))
+    return text[:bisect_right(widths, cols)]
+
+
+@lru_cache(maxsize=LAYOUT_CACHE_SIZE)
+def layout_text(text: str, cols: int, wrap_around: bool, insert_spaces: bool):
+    if not wrap_around or cols <= 0:
+        if not insert_spaces:
+            return text
+        return ''.join(map(lambda cluster: cluster + ' ', split_clusters(text)))
+
+    widths = '' if text.isascii() else text_widths(text)
+    if '\x00' not in widths and '\x02' not in widths:
+        if not insert_spaces:
+            return '\n'.join(map(lambda begin: text[begin:begin + cols], range(0, len(text), cols)))
+        step = (cols + 1) // 2
+        rows = list(map(lambda begin: ' '.join(text[begin:begin + step]),
+                        range(0, len(text), step)))
+        if cols % 2 == 0:
+            return '\n'.join(map(lambda row: row + ' ', rows))
+        if len(text) % step:
+            rows[-1] += ' '
+        else:
+            rows.append('')
+        return '\n'.join(rows)
+
+    clusters = text
+    if '\x00' in widths:
+        clusters = split_clusters(text)
+        widths = text_widths(''.join(map(lambda cluster: cluster[0], clusters)))
+        widths = widths.replace('\x00', '\x01')
+    if insert_spaces:
+        cells = widths.replace('\x01', '\x01\x00').replace('\x02', '\x02\x00\x00')
+    else:
+        cells = widths.replace('\x02', '\x02\x00')
+    limit = cols + insert_spaces
+    rows = list()
+    begin = cell_begin = 0
+    while begin < len(clusters):
+        cell_end = cell_begin + limit
+        if cell_end >= len(cells):
+            cell_end = len(cells)
+        while cells[cell_end:cell_end + 1] == '\x00':
+            cell_end -= 1
+        if cell_end == cell_begin:
+            cell_end += ord(cells[cell_begin]) + insert_spaces
+        end = begin + cell_end - cell_begin - cells.count('\x00', cell_begin, cell_end)
+        if not insert_spaces:
+            row = clusters[begin:end]
+            rows.append(row if clusters is text else ''.join(row))
+        elif cell_end - cell_begin > cols:
+            rows.append(' '.join(clusters[begin:end]))
+            if end == len(clusters):
+                rows.append('')
         else:
-            self.nav.pull(ch)
+            rows.append(' '.join(clusters[begin:end]) + ' ')
+        begin = end
+        cell_begin = cell_end
+    return '\n'.join(rows)
+
+
+def split_clusters(text: str):
+    if text.isascii():
+        return text
+    clusters = list()
+    for ch in text:
+        if clusters and not char_width(ch):
+            clusters[-1] += ch
+        else:
+            clusters.append(ch)
+    return clusters
+
+
+def parse_time_format(value):
+    # yaml reads unquoted off as False
+    if value is False or value is None:
+        return TimeFormat.OFF
+    try:
+        return TimeFormat(str(value))
+    except ValueError:
+        names = ', '.join(map(lambda time_format: time_format.value, TimeFormat))
+        raise ValueError(f"Invalid timestamps: {value}, expected one of {names}")
 
 
 def start_stdscr():
@@ -816,6 +2850,129 @@ def find_serial_port():
     return ports[device_num].device
 
 
+def create_selector(reader: SerialReader):
+    signals, signals_writer = os.pipe()
+    os.set_blocking(signals, False)
+    os.set_blocking(signals_writer, False)
+    signal.set_wakeup_fd(signals_writer)
+    signal.signal(signal.SIGWINCH, lambda signum, frame: None)
+
+    selector = selectors.DefaultSelector()
+    selector.register(sys.stdin, selectors.EVENT_READ)
+    selector.register(reader, selectors.EVENT_READ)
+    selector.register(signals, selectors.EVENT_READ, True)
+    return selector
+
+
+def open_port(port_config, config):
+    port = port_config.get('port', None)
+    if port is None:
+        port = find_serial_port()
+    return serial.Serial(
+        port,
+        port_config.get('baudrate', config.get('baudrate', 115200)),
+        timeout=0)
+
+
+def create_decoder(port_config, config, elf: str):
+    elf = port_config.get('elf', elf or config.get('elf', None))
+    return LogsDecoder(config.get('separator', ': '),
+                       ElfStrings(elf) if elf else None,
+                       config.get('binary_max_length', FRAME_MAX_LENGTH))
+
+
+def find_archives(logs_dir: str):
+    paths = list()
+    for root, dirs, files in os.walk(logs_dir):
+        if root == logs_dir:
+            dirs[:] = list(filter(lambda name: name not in [SEARCH_DIR, MERGED_DIR], dirs))
+        for name in files:
+            archive = SEARCH_FILE.fullmatch(name)
+            if archive:
+                paths.append((root, archive.group(1), int(archive.group(2) or 0), name))
+    return list(map(lambda path: os.path.join(path[0], path[3]), sorted(paths)))
+
+
+def search_range(data, begin: int, end: int, matcher: LogsFilter):
+    if begin > 0:
+        begin = data.find(b'\n', begin - 1) + 1 or len(data)
+    if end < len(data):
+        end = data.find(b'\n', end - 1) + 1 or len(data)
+    matches = list()
+    lines_count = 0
+    counted = begin
+    pos = begin
+    while pos < end:
+        pos = matcher.find(data, pos, end)
+        if pos < 0 or pos >= end:
+            break
+        line_begin = max(begin, data.rfind(b'\n', begin, pos) + 1)
+        line_end = data.find(b'\n', pos, end)
+        line_end = end if line_end < 0 else line_end
+        if matcher.exact or matcher.contains(data, line_begin, line_end):
+            lines_count += data[counted:line_begin].count(b'\n')
+            counted = line_begin
+            matches.append((lines_count, line_begin,
+                            data[line_begin:line_end].decode(errors='replace')))
+        pos = line_end + 1
+    return lines_count + data[counted:end].count(b'\n'), matches
+
+
+def search_shard(path: str, begin: int, end: int, expression: str):
+    matcher = LogsFilter(expression)
+    if path.endswith('.gz'):
+        with gzip.open(path, 'rb') as file:
+            data = file.read()
+        return search_range(data, 0, len(data), matcher)
+    with open(path, 'rb') as file:
+        if not os.fstat(file.fileno()).st_size:
+            return 0, []
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return search_range(data, begin, end, matcher)
+
+
+def search_archives(logs_dir: str, expression: str, workers: int = None):
+    LogsFilter(expression)
+    shards = list()
+    for path in find_archives(logs_dir):
+        size = os.path.getsize(path)
+        if path.endswith('.gz') or not size:
+            shards.append((path, 0, size))
+        else:
+            shards += list(map(lambda begin: (path, begin, min(size, begin + SEARCH_CHUNK_SIZE)),
+                               range(0, size, SEARCH_CHUNK_SIZE)))
+    if not shards:
+        return
+
+    # forking the monitor would copy its serial reader and curses threads
+    start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() \
+        else 'spawn'
+    executor = ProcessPoolExecutor(workers, multiprocessing.get_context(start_method))
+    try:
+        results = executor.map(search_shard,
+                               *zip(*shards),
+                               [expression] * len(shards))
+        first_line = 0
+        for shard_num, (lines_count, matches) in enumerate(results):
+            if shard_num and shards[shard_num][0] != shards[shard_num - 1][0]:
+                first_line = 0
+            for line_num, offset, text in matches:
+                yield shards[shard_num][0], first_line + line_num + 1, offset, text
+            first_line += lines_count
+    finally:
+        executor.shutdown(cancel_futures=True)
+
+
+def search_command(logs_dir: str, expression: str, workers: int):
+    try:
+        for path, line_num, offset, text in search_archives(logs_dir, expression, workers):
+            print(f"{os.path.relpath(path, logs_dir)}:{line_num}:{offset}: {text}")
+    except re.error as e:
+        exit_with_error(e)
+    except (KeyboardInterrupt, BrokenPipeError):
+        exit()
+
+
 def main():
     script_dir = os.path.dirname(os.path.abspath(__file__))
     default_config_path = os.path.join(script_dir, "config.yaml")
@@ -830,47 +2987,99 @@ def main():
                         help="Config in yaml format")
     parser.add_argument("--logs_dir", default=default_logs_dir,
                         help="Dir for logs collecting")
+    parser.add_argument("--elf",
+                        help="Firmware ELF with strings of tokenized logs")
+    parser.add_argument("--replay", nargs='+',
+                        help="Raw captures fed at full speed instead of ports, in order of ports")
+    subparsers = parser.add_subparsers(dest='command')
+    search_parser = subparsers.add_parser(
+        'search', help="Search logs of all sessions in logs dir in parallel")
+    search_parser.add_argument("expression",
+                               help="Filter expression, e.g. 'level:ERR !timeout'")
+    search_parser.add_argument("--logs_dir", default=argparse.SUPPRESS,
+                               help="Dir of collected logs")
+    search_parser.add_argument("--workers", type=int,
+                               help="Count of worker processes. Default count of cores")
     args = parser.parse_args()
 
+    if args.command == 'search':
+        search_command(args.logs_dir, args.expression, args.workers)
+        return
+
     try:
         config = yaml.safe_load(open(args.config))
     except FileNotFoundError as e:
         exit_with_error(e)
 
+    ports_config = config.get('ports', None) or [config]
     try:
-        port = config.get('port', None)
-        if port is None:
-            port = find_serial_port()
-        ser = serial.Serial(
-            port,
-            config.get('baudrate', 115200),
-            timeout=.01)
-    except serial.serialutil.SerialException as e:
+        if args.replay:
+            if len(args.replay) > len(ports_config):
+                raise ValueError(f"More replayed captures than ports: {len(args.replay)}")
+            ports_config = ports_config[:len(args.replay)]
+            ports = list(map(ReplayPort, args.replay))
+        else:
+            ports = list(map(lambda port_config: open_port(port_config, config), ports_config))
+    except (serial.serialutil.SerialException, OSError, ValueError) as e:
         exit_with_error(e)
     except KeyboardInterrupt:
         exit()
 
+    try:
+        decoders = list(map(lambda port_config: create_decoder(port_config, config, args.elf),
+                            ports_config))
+    except (OSError, ValueError) as e:
+        exit_with_error(e)
+
+    reader = SerialReader(ports,
+                          config.get('queue_size', 100000),
+                          decoders,
+                          bool(args.replay),
+                          config.get('partial_line_timeout', 0.2))
+
     stdscr = start_stdscr()
-    logs_monitor = LogsMonitor(stdscr, config, args.logs_dir)
+    try:
+        logs_monitor = LogsMonitor(stdscr, config, args.logs_dir, reader)
+        if config.get('raw_capture', False):
+            reader.captures = list(map(lambda logs: logs.logs_file.open_capture(),
+                                       logs_monitor.ports_logs[:len(ports)]))
+    except (OSError, ValueError, re.error) as e:
+        exit_stdscr_with_error(stdscr, e)
+    except KeyboardInterrupt:
+        exit_stdscr(stdscr)
+    reader.start()
+    selector = create_selector(reader) if os.name != 'nt' else None
 
     try:
         while True:
-            logs_monitor.pull()
+            if selector is None:
+                wait_time = logs_monitor.wait_time()
+                time.sleep(POLL_INTERVAL if wait_time is None else min(wait_time, POLL_INTERVAL))
+                logs_monitor.pull()
+            else:
+                for key, _ in selector.select(logs_monitor.wait_time()):
+                    if key.fileobj is sys.stdin:
+                        logs_monitor.pull()
+                    elif key.data and signal.SIGWINCH in os.read(key.fd, 64):
+                        logs_monitor.resize()
 
             try:
-                log = str(ser.readline().decode().strip('\r\n\0'))
-            except UnicodeDecodeError:
-                continue
+                logs = reader.read_logs(0)
             except serial.serialutil.SerialException as e:
                 exit_stdscr_with_error(stdscr, e)
 
-            if len(log):
-                logs_monitor.on_log(log)
+            for source, log, stamp, prefix, device_time in logs:
+                logs_monitor.on_log(log, source, stamp, prefix, device_time)
+            logs_monitor.render()
+            logs_monitor.tick()
 
     except KeyboardInterrupt:
         exit_stdscr(stdscr)
     except ValueError as e:
         exit_stdscr_with_error(stdscr, e)
+    finally:
+        reader.stop()
+        logs_monitor.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,554 @@
+import curses
+import gzip
+import os
+import re
+import struct
+import tempfile
+import unittest
+from itertools import accumulate
+from unittest import mock
+
+import yaml
+
+from serial_monitor import LogsFile, FlushPolicy, LogsFilter, LogsDecoder, PrefixTrie, ElfStrings, \
+    SerialReader, ReplayPort, Navigation, CursorMove, FieldPattern, TimeFormat, search_archives, \
+    layout_text, text_widths, char_width, parse_time_format, FIELD_KEY_VALUE
+
+
+def open_files(logs_file: LogsFile):
+    return sum(map(lambda segment: 3 - [segment.writer, segment.reader, segment.map].count(None),
+                   logs_file.segments))
+
+
+class TestLogsFile(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.logs_dir = self.temp_dir.name
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_flush_policy_holds_writes(self):
+        logs_file = LogsFile(self.logs_dir, flush_policy=FlushPolicy(64 * 1024, 1000))
+        segment = logs_file.segments[-1]
+        for num in range(1000):
+            logs_file.write_log(f"INF: line {num:04d} " + 'x' * 40)
+        self.assertLess(segment.size, 64 * 1024)
+        self.assertEqual(os.path.getsize(segment.path), 0)
+        self.assertEqual(segment.flushed, 0)
+
+        segment.last_flush -= 1000
+        logs_file.flush_if_due()
+        self.assertEqual(os.path.getsize(segment.path), segment.size)
+
+        while segment.size - segment.flushed < 64 * 1024 - 64:
+            logs_file.write_log("INF: line " + 'x' * 40)
+        self.assertEqual(os.path.getsize(segment.path), segment.flushed)
+        self.assertLess(segment.flushed, segment.size)
+        for num in range(2):
+            logs_file.write_log("INF: line " + 'x' * 40)
+        self.assertEqual(os.path.getsize(segment.path), segment.size)
+        self.assertEqual(segment.flushed, segment.size)
+        logs_file.close()
+
+    def test_spill_on_stop_without_memory(self):
+        with self.assertRaises(ValueError):
+            LogsFile(self.logs_dir, spill_on_stop=True)
+        self.assertEqual(os.listdir(self.logs_dir), [])
+
+    def test_spill_on_stop_from_memory(self):
+        logs_file = LogsFile(self.logs_dir, memory_size=64 * 1024, spill_on_stop=True)
+        for num in range(5):
+            logs_file.write_log(f"INF: a{num}")
+        logs_file.hold_cursor()
+        logs_file.unhold_cursor()
+        logs_file.write_log("INF: a5")
+        logs_file.hold_cursor()
+        logs_file.close()
+
+        self.assertEqual(os.listdir(self.logs_dir), [f"{logs_file.session}.spill.log"])
+        with open(os.path.join(self.logs_dir, f"{logs_file.session}.spill.log"), 'rb') as file:
+            self.assertEqual(file.read().split(b'\n'),
+                             list(map(lambda num: f"INF: a{num}".encode(), range(6))))
+        self.assertEqual(list(logs_file.read_logs(10)),
+                         list(map(lambda num: f"INF: a{num}", range(6))))
+
+    def test_memory_size_counts_lines(self):
+        logs_dir = os.path.join(self.logs_dir, 'logs')
+        logs_file = LogsFile(logs_dir, memory_size=16 * 1024)
+        for num in range(2000):
+            logs_file.write_log(f"INF: {num}")
+        self.assertFalse(os.path.exists(logs_dir))
+        self.assertEqual(list(logs_file.read_logs(1)), ["INF: 1999"])
+        for segment in logs_file.segments:
+            self.assertLessEqual(segment.size + len(segment.index) * 25, 1024)
+        buffers = list(map(lambda segment: id(segment.buffer), logs_file.segments))
+        for num in range(200):
+            logs_file.write_log(f"INF: {num}")
+        self.assertIn(id(logs_file.segments[-1].buffer), buffers)
+
+    def test_memory_truncates_long_lines(self):
+        logs_file = LogsFile(self.logs_dir, memory_size=16 * 1024)
+        logs_file.write_log("INF: " + 'é' * 1000)
+        log, = logs_file.read_logs(1)
+        self.assertTrue(log.endswith('é…'))
+        self.assertLessEqual(len(log.encode()) + 25, 1024)
+
+    def test_read_logs_resized_in_place(self):
+        logs_file = LogsFile(self.logs_dir, segment_size=256)
+        logs = list(map(lambda num: f"{'ERR' if num % 3 else 'INF'}: {num}", range(100)))
+        for log in logs:
+            logs_file.write_log(log)
+        for expression in ['', 'ERR']:
+            logs_file.set_filter(expression)
+            expected = list(filter(LogsFilter(expression).match, logs))
+            buffer = logs_file.read_logs(5)
+            for size in [5, 20, 3, 0, 7]:
+                self.assertIs(logs_file.read_logs(size), buffer)
+                self.assertEqual(list(buffer), expected[len(expected) - size:] if size else [])
+            logs_file.write_log("ERR: new")
+            logs.append("ERR: new")
+            self.assertEqual(list(logs_file.read_logs(7)),
+                             list(filter(LogsFilter(expression).match, logs))[-7:])
+        logs_file.close()
+
+    def test_rotated_segments_release_files(self):
+        logs_file = LogsFile(self.logs_dir, segment_size=1024)
+        for num in range(2000):
+            logs_file.write_log(f"INF: line {num:04d} " + 'x' * 40)
+        self.assertGreater(len(logs_file.segments), 100)
+        self.assertLessEqual(open_files(logs_file), 3)
+
+        logs_file.set_filter('1999')
+        self.assertEqual(list(logs_file.matches[logs_file.selection]), [1999])
+        logs_file.set_filter('')
+        logs_file.goto_line(1)
+        logs_file.move_cursor(CursorMove.DOWN, 9)
+        self.assertEqual(list(logs_file.read_logs(2)),
+                         ["INF: line 0008 " + 'x' * 40, "INF: line 0009 " + 'x' * 40])
+        self.assertLessEqual(open_files(logs_file), 5)
+        logs_file.close()
+
+    def test_remove_deletes_segments(self):
+        logs_file = LogsFile(self.logs_dir, save_index=True, segment_size=1024)
+        for num in range(100):
+            logs_file.write_log(f"INF: line {num:04d} " + 'x' * 40)
+        self.assertGreater(len(os.listdir(self.logs_dir)), 1)
+        logs_file.remove()
+        self.assertEqual(os.listdir(self.logs_dir), [])
+
+    def test_compressed_segments_replace_logs(self):
+        logs_file = LogsFile(self.logs_dir, segment_size=1024, compress_segments=True)
+        for num in range(100):
+            logs_file.write_log(f"INF: line {num:04d} " + 'x' * 40)
+        for segment in logs_file.segments:
+            if segment.compressor is not None:
+                segment.compressor.join()
+        logs_file.flush_if_due()
+
+        names = sorted(os.listdir(self.logs_dir))
+        self.assertEqual(len(names), len(logs_file.segments))
+        self.assertEqual(list(filter(lambda name: not name.endswith('.log.gz'), names)),
+                         [os.path.basename(logs_file.segments[-1].path)])
+        self.assertEqual(logs_file.compressing, [])
+
+        logs_file.goto_line(1)
+        self.assertEqual(list(logs_file.read_logs(1)), ["INF: line 0000 " + 'x' * 40])
+        logs_file.close()
+
+    def test_failed_compression_keeps_logs(self):
+        logs_file = LogsFile(self.logs_dir, segment_size=1024, compress_segments=True)
+        with mock.patch('serial_monitor.shutil.copyfileobj', side_effect=OSError("No space")):
+            for num in range(100):
+                logs_file.write_log(f"INF: line {num:04d} " + 'x' * 40)
+            for segment in logs_file.segments:
+                if segment.compressor is not None:
+                    segment.compressor.join()
+        logs_file.flush_if_due()
+
+        self.assertEqual(list(filter(lambda name: not name.endswith('.log'),
+                                     os.listdir(self.logs_dir))), [])
+        self.assertFalse(any(map(lambda segment: segment.compressed, logs_file.segments)))
+        logs_file.goto_line(1)
+        self.assertEqual(list(logs_file.read_logs(1)), ["INF: line 0000 " + 'x' * 40])
+        logs_file.close()
+
+
+class TestLogsFilter(unittest.TestCase):
+    LOGS = ['INF: Temp 20', 'WRN: temp high', 'ERR: Timeout', 'DBG: x', 'INF: Timeout retry',
+            '[port] ERR: Temp sensor', 'plain text', 'INF: a|b', '']
+
+    def assertMatches(self, expression: str, expected: list):
+        self.assertEqual(list(filter(LogsFilter(expression).match, self.LOGS)), expected,
+                         expression)
+
+    def assertFinds(self, expression: str):
+        matcher = LogsFilter(expression)
+        data = '\n'.join(self.LOGS).encode()
+        found = list()
+        pos = 0
+        while pos <= len(data):
+            pos = matcher.find(data, pos, len(data))
+            if pos < 0:
+                break
+            begin = data.rfind(b'\n', 0, pos) + 1
+            end = data.find(b'\n', pos)
+            end = len(data) if end < 0 else end
+            if matcher.exact or matcher.contains(data, begin, end):
+                found.append(data[begin:end].decode())
+            pos = end + 1
+        self.assertEqual(found, list(filter(matcher.match, self.LOGS)), expression)
+
+    def test_terms(self):
+        self.assertMatches('', self.LOGS)
+        self.assertMatches('Temp', ['INF: Temp 20', '[port] ERR: Temp sensor'])
+        self.assertMatches('Temp 20', ['INF: Temp 20'])
+        self.assertMatches('"Temp 20"', ['INF: Temp 20'])
+        self.assertMatches('Timeout INF', ['INF: Timeout retry'])
+        self.assertMatches('Temp | Timeout', ['INF: Temp 20', 'ERR: Timeout', 'INF: Timeout retry',
+                                              '[port] ERR: Temp sensor'])
+        self.assertMatches('/T.m/', ['INF: Temp 20', 'ERR: Timeout', 'INF: Timeout retry',
+                                     '[port] ERR: Temp sensor'])
+        self.assertMatches('"a|b"', ['INF: a|b'])
+
+    def test_negation(self):
+        self.assertMatches('Timeout !retry', ['ERR: Timeout'])
+        self.assertMatches('!INF', ['WRN: temp high', 'ERR: Timeout', 'DBG: x',
+                                    '[port] ERR: Temp sensor', 'plain text', ''])
+        self.assertMatches('!/^$/ !:', ['plain text'])
+
+    def test_levels(self):
+        self.assertMatches('level:ERR', ['ERR: Timeout', '[port] ERR: Temp sensor'])
+        self.assertMatches('level:WRN+', ['WRN: temp high', 'ERR: Timeout',
+                                          '[port] ERR: Temp sensor'])
+        self.assertMatches('level:DBG,WRN', ['WRN: temp high', 'DBG: x'])
+        self.assertMatches('!level:INF+', ['DBG: x', 'plain text', ''])
+        self.assertMatches('level:ERR Temp', ['[port] ERR: Temp sensor'])
+
+    def test_ignore_case(self):
+        self.assertMatches('(?i)temp', ['INF: Temp 20', 'WRN: temp high',
+                                        '[port] ERR: Temp sensor'])
+        self.assertMatches('(?i)TIMEOUT !Retry', ['ERR: Timeout'])
+        self.assertMatches('temp', ['WRN: temp high'])
+
+    def test_finders(self):
+        self.assertTrue(LogsFilter('Temp').exact)
+        self.assertTrue(LogsFilter('Temp | Timeout').exact)
+        self.assertFalse(LogsFilter('Timeout !retry').exact)
+        self.assertFalse(LogsFilter('/T.m/').exact)
+        self.assertTrue(LogsFilter('(?i)temp').exact)
+        self.assertIsNone(LogsFilter('!INF').text_finder)
+        for expression in ['Temp', 'Temp | Timeout', '"a|b"', 'Timeout !retry', '/T.m/', '!INF',
+                           'level:WRN+', 'level:ERR Temp', '(?i)temp', '(?i)TIMEOUT !Retry']:
+            self.assertFinds(expression)
+
+    def test_invalid_regex(self):
+        with self.assertRaises(re.error):
+            LogsFilter('/(/')
+
+
+class TestSearchArchives(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.logs_dir = self.temp_dir.name
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def write_logs(self, name: str, logs: list):
+        path = os.path.join(self.logs_dir, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = '\n'.join(logs).encode()
+        with (gzip.open if name.endswith('.gz') else open)(path, 'wb') as file:
+            file.write(data)
+
+    def search(self, expression: str):
+        return list(map(lambda match: (os.path.relpath(match[0], self.logs_dir), *match[1:]),
+                        search_archives(self.logs_dir, expression, 2)))
+
+    def test_matches_of_all_sessions_in_order(self):
+        logs = list(map(lambda num: f"{'ERR' if num % 7 == 0 else 'INF'}: line {num}", range(50)))
+        self.write_logs('2024-01-02 10:00:00.000000.log', logs)
+        self.write_logs('2024-01-01 10:00:00.000000.log', ['ERR: first'])
+        self.write_logs('2024-01-02 10:00:00.000000.1.log.gz', ['INF: a', 'ERR: packed'])
+        self.write_logs('port/2024-01-03 10:00:00.000000.log', ['ERR: port'])
+        self.write_logs('search/2024-01-03 10:00:00.000000.log', ['ERR: search'])
+        self.write_logs('merged/2024-01-03 10:00:00.000000.log', ['ERR: merged'])
+        self.write_logs('2024-01-04 10:00:00.000000.log', [])
+
+        offsets = list(accumulate(map(lambda log: len(log) + 1, logs), initial=0))
+        expected = [('2024-01-01 10:00:00.000000.log', 1, 0, 'ERR: first')]
+        expected += list(map(lambda num: ('2024-01-02 10:00:00.000000.log', num + 1,
+                                          offsets[num], logs[num]), range(0, 50, 7)))
+        expected += [('2024-01-02 10:00:00.000000.1.log.gz', 2, 7, 'ERR: packed'),
+                     ('port/2024-01-03 10:00:00.000000.log', 1, 0, 'ERR: port')]
+        with mock.patch('serial_monitor.SEARCH_CHUNK_SIZE', 64):
+            self.assertEqual(self.search('level:ERR'), expected)
+            self.assertEqual(self.search('"line 4" !level:ERR'),
+                             list(map(lambda num: ('2024-01-02 10:00:00.000000.log', num + 1,
+                                                   offsets[num], logs[num]),
+                                      [4, 40, 41, 43, 44, 45, 46, 47, 48])))
+
+    def test_shard_boundaries(self):
+        logs = list(map(lambda num: f"INF: {'x' * (num % 13)} match {num}", range(200)))
+        self.write_logs('2024-01-01 10:00:00.000000.log', logs)
+        for chunk_size in [1, 7, 32, 64, 1 << 20]:
+            with mock.patch('serial_monitor.SEARCH_CHUNK_SIZE', chunk_size):
+                matches = self.search('match')
+            self.assertEqual(list(map(lambda match: (match[1], match[3]), matches)),
+                             list(map(lambda num: (num + 1, logs[num]), range(200))), chunk_size)
+
+
+class TestFieldPattern(unittest.TestCase):
+    def test_key_value_pairs(self):
+        field_pattern = FieldPattern('INF: ', FIELD_KEY_VALUE)
+        self.assertEqual(field_pattern.parse('INF: temp=20, hum=40;sensor.id=a1 done'),
+                         [('temp', '20'), ('hum', '40'), ('sensor.id', 'a1')])
+        self.assertEqual(field_pattern.parse('INF: no fields'), [])
+
+    def test_prefix_skipped(self):
+        field_pattern = FieldPattern('a=1 ', FIELD_KEY_VALUE)
+        self.assertEqual(field_pattern.parse('a=1 b=2'), [('b', '2')])
+
+    def test_named_groups(self):
+        field_pattern = FieldPattern('', r'T=(?P<temp>\d+)(?: H=(?P<hum>\d+))?')
+        self.assertEqual(field_pattern.parse('INF: T=20 H=40'), [('temp', '20'), ('hum', '40')])
+        self.assertEqual(field_pattern.parse('INF: T=20'), [('temp', '20')])
+        self.assertEqual(field_pattern.parse('INF: H=40'), [])
+
+    def test_invalid_patterns(self):
+        for pattern in [r'(\w+)', r'(\w+)=(\w+) (\w+)', r'\w+=\w+']:
+            with self.assertRaises(ValueError):
+                FieldPattern('', pattern)
+        with self.assertRaises(re.error):
+            FieldPattern('', r'(\w+=')
+
+
+class TestTimeFormat(unittest.TestCase):
+    def test_yaml_values(self):
+        for text, time_format in [('off', TimeFormat.OFF), ("'off'", TimeFormat.OFF),
+                                  ('absolute', TimeFormat.ABSOLUTE), ('delta', TimeFormat.DELTA),
+                                  ('device', TimeFormat.DEVICE), ('', TimeFormat.OFF)]:
+            config = yaml.safe_load(f"timestamps: {text}")
+            self.assertEqual(parse_time_format(config['timestamps']), time_format, text)
+
+    def test_invalid_value(self):
+        for text in ['on', 'yes', '1']:
+            with self.assertRaises(ValueError):
+                parse_time_format(yaml.safe_load(f"timestamps: {text}")['timestamps'])
+
+
+def layout_charwise(text: str, cols: int, wrap_around: bool, insert_spaces: bool):
+    col = 0
+    formated_text = ''
+    for ch in text:
+        if wrap_around and col >= cols:
+            col = 0
+            formated_text += '\n'
+        formated_text += ch
+        col += 1
+        if insert_spaces:
+            if wrap_around and col >= cols:
+                col = 0
+                formated_text += '\n'
+            else:
+                formated_text += ' '
+                col += 1
+    return formated_text
+
+
+class TestLayoutText(unittest.TestCase):
+    def test_ascii_as_charwise(self):
+        for length in range(12):
+            text = ''.join(map(lambda num: chr(ord('a') + num), range(length)))
+            for cols in range(1, 8):
+                for wrap_around in [False, True]:
+                    for insert_spaces in [False, True]:
+                        args = (text, cols, wrap_around, insert_spaces)
+                        self.assertEqual(layout_text(*args), layout_charwise(*args), args)
+
+    def test_wide_chars_at_edge(self):
+        self.assertEqual(layout_text('ab\u4e2dc', 4, True, False), 'ab\u4e2d\nc')
+        self.assertEqual(layout_text('abc\u4e2dd', 4, True, False), 'abc\n\u4e2dd')
+        self.assertEqual(layout_text('\u4e2d\u4e2d', 1, True, False), '\u4e2d\n\u4e2d')
+        self.assertEqual(layout_text('a\u4e2db', 5, True, True), 'a \u4e2d \nb ')
+        self.assertEqual(layout_text('a\u4e2db', 4, True, True), 'a \u4e2d\nb ')
+        self.assertEqual(layout_text('ab\u4e2d', 3, True, True), 'a b\n\u4e2d ')
+
+    def test_combining_chars_at_edge(self):
+        self.assertEqual(layout_text('abce\u0301f', 4, True, False), 'abce\u0301\nf')
+        self.assertEqual(layout_text('e\u0301\u0302x', 1, True, False), 'e\u0301\u0302\nx')
+        self.assertEqual(layout_text('ae\u0301', 2, True, True), 'a \ne\u0301 ')
+        self.assertEqual(layout_text('e\u0301x', 4, False, True), 'e\u0301 x ')
+        self.assertEqual(layout_text('\u4e2d\u0301a', 2, True, False), '\u4e2d\u0301\na')
+
+    def test_widths_as_charwise(self):
+        for text in ['caf\xe9 20\xb0C', 'soft\xadhyphen', '\u6e29\u5ea6=23', '\u3000\u303f\u302a',
+                     '\uff01\uff61', '\uff61\uff62 \u2192', 'e\u0301', 'ok \U0001f600',
+                     '\u2192\u2026\u200b']:
+            widths = ''.join(map(lambda ch: chr(char_width(ch)), text))
+            self.assertEqual(text_widths(text), widths, text)
+            if widths.strip('\x01'):
+                continue
+            for cols in range(1, 6):
+                for insert_spaces in [False, True]:
+                    args = (text, cols, True, insert_spaces)
+                    self.assertEqual(layout_text(*args), layout_charwise(*args), args)
+
+
+class TestNavigation(unittest.TestCase):
+    def test_escape_from_search_resumes(self):
+        logs = mock.Mock()
+        logs.name = 'port'
+        nav = Navigation(mock.Mock(), [logs], 0)
+        nav.pull(curses.KEY_F3)
+        self.assertTrue(nav.searching)
+        self.assertTrue(nav.stoped)
+        nav.pull(27)
+        self.assertFalse(nav.searching)
+        self.assertFalse(nav.stoped)
+        logs.unhold_cursor.assert_called_once()
+
+
+def frame(level: int, text: str, device_time: int = 5):
+    payload = text.encode()
+    return bytes([0xfe, level, device_time, len(payload)]) + payload
+
+
+class TestLogsDecoder(unittest.TestCase):
+    def test_frame_after_unterminated_text(self):
+        decoder = LogsDecoder()
+        logs = decoder.feed(b'boot msg' + frame(2, 'hi') + b'tail\n')
+        self.assertEqual(logs, [('boot msg', None, None), ('INF: hi', decoder.prefixes[2], 5),
+                                ('tail', None, None)])
+        self.assertEqual(decoder.decode_errors, 0)
+
+    def test_frame_split_across_feeds(self):
+        decoder = LogsDecoder()
+        data = b'boot' + frame(3, 'warned') + frame(0x82, 'raw', 0x7f) + b'text\n'
+        logs = list()
+        for pos in range(len(data)):
+            logs += decoder.feed(data[pos:pos + 1])
+        logs += decoder.flush()
+        self.assertEqual(logs, [('boot', None, None), ('WRN: warned', decoder.prefixes[3], 5),
+                                ('raw', None, 0x7f), ('text', None, None)])
+        self.assertEqual(decoder.decode_errors, 0)
+
+    def test_invalid_magic_is_text(self):
+        decoder = LogsDecoder()
+        logs = decoder.feed(b'a\xfe\x09b\n')
+        self.assertEqual(logs, [('a\ufffd\tb', None, None)])
+        self.assertEqual(decoder.decode_errors, 1)
+
+    def test_multibyte_device_time(self):
+        decoder = LogsDecoder()
+        data = b'\xfe\x02\x90\x4e\x02hi'
+        self.assertEqual(decoder.feed(data[:3]), [])
+        self.assertEqual(decoder.feed(data[3:]), [('INF: hi', decoder.prefixes[2], 10000)])
+
+    def test_frame_over_max_length_is_text(self):
+        decoder = LogsDecoder()
+        logs = decoder.feed(b'\xfe\x02\x05\x81\x02after\n')
+        self.assertEqual(logs, [('\ufffd\x02\x05\ufffd\x02after', None, None)])
+
+    def test_tokens_resolved_once(self):
+        strings = mock.Mock()
+        strings.get.side_effect = lambda address: 'Temp ' if address == 0x1234 else None
+        decoder = LogsDecoder(strings=strings)
+        payload = b's\xb4\x24i\x03s\x01u\x85\x03z C\0'
+        data = bytes([0xfe, 0x42, 5, len(payload)]) + payload
+        logs = decoder.feed(data * 3)
+        self.assertEqual(logs, [('INF: Temp -2<0x1>389 C', decoder.prefixes[2], 5)] * 3)
+        self.assertEqual(strings.get.call_count, 2)
+        self.assertEqual(decoder.decode_errors, 0)
+
+
+class TestSerialReader(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, 'port.raw')
+        with open(self.path, 'wb') as file:
+            file.write(b'INF: a\nINF: b\nrest')
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_stop_closes_captures(self):
+        logs_file = LogsFile(self.temp_dir.name)
+        reader = SerialReader([ReplayPort(self.path)], 10, [LogsDecoder()], True, 0.01)
+        capture = logs_file.open_capture()
+        reader.captures = [capture]
+        reader.start()
+        logs = list()
+        while len(logs) < 3:
+            logs += map(lambda log: log[1], reader.read_logs(1))
+        reader.stop()
+        self.assertEqual(logs, ['INF: a', 'INF: b', 'rest'])
+        self.assertFalse(reader.is_alive())
+        self.assertTrue(capture.closed)
+        with open(capture.name, 'rb') as file:
+            self.assertEqual(file.read(), b'INF: a\nINF: b\nrest')
+        logs_file.close()
+
+    def test_ports_polled_on_windows(self):
+        with mock.patch('serial_monitor.os.name', 'nt'):
+            reader = SerialReader([ReplayPort(self.path)], 10, [LogsDecoder()], True, 0.01)
+        self.assertIsNone(reader.selector)
+        reader.start()
+        logs = list()
+        while len(logs) < 3:
+            logs += map(lambda log: log[1], reader.read_logs(1))
+        reader.stop()
+        self.assertEqual(logs, ['INF: a', 'INF: b', 'rest'])
+        self.assertFalse(reader.is_alive())
+
+    def test_stop_without_start_closes_captures(self):
+        reader = SerialReader([ReplayPort(self.path)], 10, [LogsDecoder()])
+        capture = LogsFile(self.temp_dir.name).open_capture()
+        reader.captures = [capture]
+        reader.stop()
+        self.assertTrue(capture.closed)
+
+
+class TestPrefixTrie(unittest.TestCase):
+    def test_match_with_known_prefix(self):
+        trie = PrefixTrie()
+        for value, prefix in enumerate(['INF: ', 'INF: Temp', 'INF: Tem', 'WRN: ', 'E']):
+            trie.add(prefix, value)
+        trie.compile()
+        for prefix in ['INF: ', 'WRN: ', 'ERR: ', 'DBG: ']:
+            for text in ['', 'x', 'Te', 'Tem', 'Temp 20', 'Temperature']:
+                log = prefix + text
+                self.assertEqual(trie.match(log, prefix), trie.match(log), log)
+
+
+class TestElfStrings(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def write_elf(self, machine: int, data_address: int):
+        data = b'\0hello\0'
+        sections = struct.pack('<10I', *[0] * 10) + \
+            struct.pack('<10I', 0, 1, 3, data_address, 52, len(data), 0, 0, 1, 0)
+        header = struct.pack('<16sHHIIIIIHHHHHH', b'\x7fELF\x01\x01\x01', 2, machine, 1, 0, 0,
+                             52 + len(data), 0, 52, 0, 0, 40, 2, 0)
+        path = os.path.join(self.temp_dir.name, 'firmware.elf')
+        with open(path, 'wb') as file:
+            file.write(header + data + sections)
+        return path
+
+    def test_avr_literals_from_data(self):
+        strings = ElfStrings(self.write_elf(83, 0x800100))
+        self.assertEqual(strings.get(0x101), 'hello')
+        self.assertIsNone(strings.get(0x200))
+
+    def test_writable_sections_skipped(self):
+        strings = ElfStrings(self.write_elf(3, 0x100))
+        self.assertIsNone(strings.get(0x101))
+
+
+if __name__ == '__main__':
+    unittest.main()